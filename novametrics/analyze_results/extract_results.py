@@ -1,8 +1,7 @@
 """
 Collection of functions to subset REopt results to facilitate metrics calculations 
 """
-import os 
-import json
+from novametrics.support.result_store import load_results
 import numpy as np
 from novametrics.analyze_results.simulate_outages import simulate_outages
 HOURS = 8760
@@ -304,8 +303,7 @@ def metadata_values(reopt_results, filename):
 
 
 def extract_results(filepath, filename):
-    with open(os.path.join(filepath, filename), 'r') as fp:
-        reopt_results = json.load(fp)
+    reopt_results = load_results(filepath, filename)
     
     d = {}
     d["metadata"] = metadata_values(reopt_results, filename)
@@ -19,12 +19,12 @@ Function `generate_metrics` returns an Excel spreadsheet of compiled metrics, wh
 """
 from pathlib import Path    
 import os
-import glob
 import numpy as np
 import pandas as pd
 pd.set_option('mode.chained_assignment', None)
 from novametrics.analyze_results.extract_results import extract_results
 from novametrics.support.utils import not_none
+from novametrics.support.result_store import list_results, strip_results_extension
 HOURS = 8760
 #%%
 def cover_factor_metrics(results):
@@ -274,7 +274,7 @@ def get_timeseries_single_case(results_folder, results_name, timesereies_output_
     d["demand_cost_per_kw"] = results["utility_bill"]["demand_charge_per_kw"]
     
     if output_file_name == "":
-        output_file_name = results_name.replace(".json", "") + "_timeseries.csv"
+        output_file_name = strip_results_extension(results_name) + "_timeseries.csv"
     
     
     #TODO add timeseries for FlexTechAC, FlexTechHP, FlexTechERWH, FlexTechHPWH    
@@ -353,7 +353,7 @@ def generate_metrics(reopt_results_folder, inputs, metrics_folder, metrics_resul
             d[sheet_name].to_excel(writer, sheet_name = sheet_name, index = False)
 #%%
 def generate_timeseries(reopt_results_folder, timeseries_output_folder):
-    paths = [f for f in glob.iglob(os.path.join(reopt_results_folder, "**"), recursive=True) if os.path.isfile(f) and f.endswith(".json")]
+    paths = list_results(reopt_results_folder)
     
     for path in paths:
         path_dir, file_name = os.path.split(path)
@@ -361,6 +361,6 @@ def generate_timeseries(reopt_results_folder, timeseries_output_folder):
         output_folder = os.path.join(timeseries_output_folder, relative_dir)
         Path(output_folder).mkdir(parents=True, exist_ok=True)
         
-        output_file_name = file_name.replace(".json", "_timeseries.csv")
+        output_file_name = strip_results_extension(file_name) + "_timeseries.csv"
         
         get_timeseries_single_case(path_dir, file_name, output_folder, output_file_name)
\ No newline at end of file
@@ -1,5 +1,7 @@
 # import sys, os
+import io
 import pandas as pd
+from novametrics.support import http_client
 # os.chdir(os.path.dirname(__file__))
 #%%
 # # Declare all variables as strings. Spaces must be replaced with '+', i.e., change 'John Smith' to 'John+Smith'.
@@ -74,6 +76,9 @@ def download_nsrdb(filename, lat, lon, api_key, year = 2019, leap_year = "false"
     mailing_list = 'false'
     attributes = 'dni,ghi,dhi,air_temperature,wind_speed,surface_pressure,relative_humidity'
     url = 'https://developer.nrel.gov/api/nsrdb/v2/solar/psm3-download.csv?wkt=POINT({lon}%20{lat})&names={year}&leap_day={leap}&interval={interval}&utc={utc}&full_name={name}&email={email}&affiliation={affiliation}&mailing_list={mailing_list}&reason={reason}&api_key={api}&attributes={attr}'.format(year=year, lat=lat, lon=lon, leap=leap_year, interval=interval, utc=utc, name=your_name, email=your_email, mailing_list=mailing_list, affiliation=your_affiliation, reason=reason_for_use, api=api_key, attr=attributes)
-    pd.read_csv(url).to_csv(filename, index = False)
+    resp = http_client.get(url)
+    # Error responses are json or html rather than weather, and must not be saved as a weather file
+    resp.raise_for_status()
+    pd.read_csv(io.StringIO(resp.text)).to_csv(filename, index = False)
     
     
\ No newline at end of file
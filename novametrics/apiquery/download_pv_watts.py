@@ -1,6 +1,6 @@
 import pandas as pd
 import os
-import requests
+from novametrics.support import http_client
 
 #download_pv_watts returns a csv of pv production factors for a given longitude and latitude location.
 #Takes in solar parameters:  tilt, azimuth, module_type, module_type, array_type, losses, dc_ac_ratio, and inv_eff 
@@ -15,7 +15,7 @@ def download_pv_watts(location_file_path, pv_watts_key, lat, lon, tilt = None, a
             f'&system_capacity=1&azimuth={azimuth}&module_type={module_type}'
             f'&array_type={array_type}&losses={round(losses*100, 3)}&dc_ac_ratio={dc_ac_ratio}'
             f'&gcr=0.4&inv_eff={inv_eff*100}&timeframe=hourly&dataset=nsrdb&radius=100')
-    watt_data = requests.get(url).json()["outputs"]["ac"]
+    watt_data = http_client.get(url).json()["outputs"]["ac"]
     	# print(url)
     prod_factor = [w/1000 for w in watt_data] #PV Watts returns value in Watts. Want kW
     
@@ -1,7 +1,7 @@
 # import json 
 import pandas as pd
 import os
-import requests
+from novametrics.support import http_client
 # os.chdir(os.path.dirname(__file__))
 #%%
 #Code finds urdb label for location. Will pull all active residential rates urdb of given utility and can find default rate for utility. 
@@ -24,7 +24,7 @@ def get_urdb_label(utility, api_key, sector = "Residential", return_default_rate
     utility_name = utility.replace("&", "%26").replace(" ", "+").replace(".", "")
     url = f"https://api.openei.org/utility_rates?version=latest&api_key={api_key}&ratesforutility={utility_name}&sector={sector}&approved=true"
     #Download rates which have not ended
-    urdb = [x for x in requests.get(url).json()["items"] if not "enddate" in x]
+    urdb = [x for x in http_client.get(url).json()["items"] if not "enddate" in x]
     if return_default_rate:
         urdb = [x for x in urdb if "is_default" in x and x["is_default"]]
     for phrase in remove_phrases:
@@ -41,7 +41,7 @@ def get_urdb_label(utility, api_key, sector = "Residential", return_default_rate
 #uses google api to get latitude longitude and from location addres
 def get_lat_lon_from_address(address, google_api_key):
     #Need to obtain a google api key. A credit card is required but api pulls are free for all but large downloads. 
-    geo = requests.get(f"https://maps.googleapis.com/maps/api/geocode/json?address={address}&key={google_api_key}").json()
+    geo = http_client.get(f"https://maps.googleapis.com/maps/api/geocode/json?address={address}&key={google_api_key}").json()
     if geo["status"] == "OK":
         lat_long = geo["results"][0]["geometry"]["location"]
         return (lat_long["lat"], lat_long["lng"])
@@ -51,7 +51,7 @@ def get_lat_lon_from_address(address, google_api_key):
 #%%
 #Uses google api to get address from latitude and longitude
 def get_address_from_latlon(lat, lon, google_api_key):
-    geo = requests.get(f"https://maps.googleapis.com/maps/api/geocode/json?latlng={lat},{lon}&key={google_api_key}").json()
+    geo = http_client.get(f"https://maps.googleapis.com/maps/api/geocode/json?latlng={lat},{lon}&key={google_api_key}").json()
     if geo["status"] == "OK":
         address = geo["results"][0]["address_components"]
         address_components = {}
@@ -7,18 +7,18 @@
 import os 
 import pandas as pd
 import numpy as np
-import json
-import copy
 # import collections.abc
 import pathlib
+from concurrent.futures import ProcessPoolExecutor
 # import novametrics.apiquery.find_urdb as Find_URDB
-from novametrics.support.utils import load_post, not_none
+from novametrics.support.utils import load_post, save_post, not_none
 from novametrics.inputs.reopt_post_support_functions import get_pv_prod_factor
 from novametrics.inputs.ochre_support_functions import load_ochre_outputs, wh_post, hvac_post
+from novametrics.inputs.post_manifest import PostManifest, manifest_file, hash_value, post_fingerprint
 #%%
 
 def create_reopt_posts(inputs_folder, inputs_file_name, default_values_file, main_output_folder, by_building = False, add_pv_prod_factor = True, solar_profile_folder = "/.", pv_watts_api_key = "",
-                       ochre_controls = {}):
+                       ochre_controls = {}, n_workers = 1, incremental = True, pretty_json = False, float_digits = None):
     """
     Create reopt json posts from input excel sheet in `inputs_folder`/`inputs_file_name`.
 
@@ -27,6 +27,11 @@ def create_reopt_posts(inputs_folder, inputs_file_name, default_values_file, mai
     If `add_pv_prod_factor` is True, then searches for pv factor csv in `solar_profile_folder` 
     and downloads from PV watts https://developer.nrel.gov/docs/solar/pvwatts/v6/ if needed.
     Optional ability to load load profiles from OCHRE model outputs.      
+    Posts are grouped into one work item per OCHRE building, so each building's OCHRE outputs are
+    loaded once however many scenario rows use them. If `n_workers` is greater than 1 then work
+    items are spread across that many worker processes.
+    If `incremental` is True then only posts which are missing, or whose inputs changed since they were
+    created (as recorded in the post manifest saved next to `main_output_folder`), are written.
 
     Parameters
     ----------
@@ -48,13 +53,30 @@ def create_reopt_posts(inputs_folder, inputs_file_name, default_values_file, mai
         key to download solar proviles from PV watts.
     ochre_controls_dict : dict
         optional dictionary of OCHRE building model output values (such as folder path).
+    n_workers : int
+        Number of worker processes to create posts with. Defaults to 1 (create posts in this process).
+    incremental : bool
+        If True (default) then posts with unchanged inputs are not rewritten. If False then all posts are rewritten.
+    pretty_json : bool
+        If True then posts are saved indented for reading. Defaults to compact json.
+    float_digits : int, optional
+        If given then floats in posts are rounded to this many significant digits.
+
+    Returns
+    -------
+    list
+        List of (output_subfolder, post_name, error message) for each post which could not be created.
     """
     pathlib.Path(solar_profile_folder).mkdir(parents=True, exist_ok=True)
     
     inputs_df = pd.read_excel(os.path.join(inputs_folder, inputs_file_name), sheet_name='REopt Posts')
-    defaults = load_post(inputs_folder, default_values_file)
+    defaults = freeze_template(load_post(inputs_folder, default_values_file))
+    column_plan = compile_column_plan(list(inputs_df.columns), list(inputs_df.dtypes))
+    # Rows as plain dictionaries, which are cheaper to copy, send to workers and read than Series
+    input_rows = inputs_df.to_dict("records")
     
-    for i, input_vals in inputs_df.iterrows():
+    work_items = {}  # OCHRE subfolder (or row number if not using OCHRE) -> ([input_vals], ochre_controls)
+    for i, input_vals in enumerate(input_rows):
         ochre_controls["use_ochre_outputs"] = False
         
         if not ochre_controls.get("ochre_outputs_main_folder"):
@@ -65,17 +87,111 @@ def create_reopt_posts(inputs_folder, inputs_file_name, default_values_file, mai
             for b in buildings:
                 ochre_controls["ochre_outputs_subfolder"] = b
                 input_vals["output_subfolder"] = b
-                create_single_reopt_post(defaults, input_vals, main_output_folder, add_pv_prod_factor, solar_profile_folder, pv_watts_api_key, ochre_controls)
+                work_items.setdefault(("ochre", b), ([], dict(ochre_controls)))[0].append(input_vals.copy())
         else:
             if ("ochre_folder" in input_vals) and not_none(input_vals["ochre_folder"]):
                 ochre_controls["use_ochre_outputs"] = True
                 ochre_controls["ochre_outputs_subfolder"] = input_vals["ochre_folder"]
-            create_single_reopt_post(defaults, input_vals, main_output_folder, add_pv_prod_factor, solar_profile_folder, pv_watts_api_key, ochre_controls)
-            
+                key = ("ochre", input_vals["ochre_folder"])
+            else:
+                key = ("row", i)
+            work_items.setdefault(key, ([], dict(ochre_controls)))[0].append(input_vals.copy())
+    work_items = list(work_items.values())
+    n_posts = sum(len(rows) for rows, controls in work_items)
+    
+    if add_pv_prod_factor and (n_workers > 1 or incremental):
+        # Download missing PV factors up front so workers don't race to download the same location
+        # and so post fingerprints include them
+        for input_vals in input_rows:
+            get_pv_prod_factor(input_vals, solar_profile_folder, defaults, pv_watts_api_key)
+    
+    manifest = PostManifest(manifest_file(main_output_folder))
+    template_hash = hash_value(defaults)
+    def fingerprint(input_vals, controls):
+        return post_fingerprint(input_vals, template_hash, controls, add_pv_prod_factor, solar_profile_folder, defaults, float_digits)
+    if incremental:
+        changed_items = []
+        for rows, controls in work_items:
+            changed_rows = [input_vals for input_vals in rows
+                            if not manifest.is_current(post_key(input_vals), fingerprint(input_vals, controls), os.path.join(main_output_folder, post_key(input_vals)))]
+            if len(changed_rows) > 0:
+                changed_items.append((changed_rows, controls))
+        work_items = changed_items
+        n_changed = sum(len(rows) for rows, controls in work_items)
+        print(f"{n_changed} of {n_posts} REopt posts are new or have changed inputs")
+        n_posts = n_changed
+    
+    post_settings = (defaults, main_output_folder, add_pv_prod_factor, solar_profile_folder, pv_watts_api_key, column_plan, pretty_json, float_digits)
+    if n_workers > 1:
+        with ProcessPoolExecutor(n_workers, initializer=set_post_settings, initargs=post_settings) as executor:
+            chunksize = max(1, min(64, len(work_items) // (4 * n_workers)))
+            errors = [e for item_errors in executor.map(create_post_work_item, work_items, chunksize=chunksize) for e in item_errors]
+    else:
+        set_post_settings(*post_settings)
+        errors = [e for item_errors in map(create_post_work_item, work_items) for e in item_errors]
+    
+    failed = set(os.path.join(subfolder, post_name + ".json") for subfolder, post_name, error in errors)
+    for rows, controls in work_items:
+        for input_vals in rows:
+            if post_key(input_vals) in failed:
+                manifest.remove(post_key(input_vals))
+            else:
+                manifest.set(post_key(input_vals), fingerprint(input_vals, controls))
+    manifest.save()
+    
+    print(f"Created {n_posts - len(errors)} of {n_posts} REopt posts")
+    for subfolder, post_name, error in errors:
+        print(f"Post {subfolder} - {post_name} failed due to {error}")
+    return errors
+
+
+def post_subfolder(input_vals):
+    """Return posts subfolder of post for `input_vals`, or "" if it is saved in the main posts folder"""
+    subfolder = input_vals.get("output_subfolder", "")
+    return subfolder if not_none(subfolder) else ""
+
+
+def post_key(input_vals):
+    """Return path of post for `input_vals` relative to the posts folder"""
+    return os.path.join(post_subfolder(input_vals), input_vals["post_name"] + ".json")
+
+#%%
+# Settings shared by all work items. Set once per worker process rather than sent with every item.
+_post_settings = ()
+
+def set_post_settings(*settings):
+    global _post_settings
+    _post_settings = settings
+
+
+def create_post_work_item(work_item):
+    """
+    Create posts for ([input_vals], ochre_controls) `work_item`, loading the OCHRE outputs they share once
+
+    Returns list of (output_subfolder, post_name, error message) for each post which failed.
+    """
+    rows, ochre_controls = work_item
+    defaults, main_output_folder, add_pv_prod_factor, solar_profile_folder, pv_watts_api_key, column_plan, pretty_json, float_digits = _post_settings
+    ochre_outputs = None
+    if ochre_controls["use_ochre_outputs"]:
+        try:
+            ochre_outputs = load_ochre_outputs(ochre_controls)
+        except Exception as e:
+            return [(post_subfolder(input_vals), input_vals.get("post_name", ""), f"OCHRE outputs failed due to {e}") for input_vals in rows]
+    errors = []
+    for input_vals in rows:
+        try:
+            create_single_reopt_post(defaults, input_vals, main_output_folder, add_pv_prod_factor, solar_profile_folder, pv_watts_api_key, ochre_controls,
+                                     ochre_outputs, column_plan, pretty_json, float_digits)
+        except Exception as e:
+            errors.append((post_subfolder(input_vals), input_vals.get("post_name", ""), str(e)))
+    return errors
+    
       
 #%%
 def create_single_reopt_post(defaults, input_vals, main_output_folder, add_pv_prod_factor = True, solar_profile_folder = "./", 
-                             pv_watts_api_key = "", ochre_controls = {}):
+                             pv_watts_api_key = "", ochre_controls = {}, ochre_outputs = None, column_plan = None, pretty_json = False,
+                             float_digits = None):
     """
     Create single reopt json posts using `defaults` as template and adding `input_vals`
 
@@ -90,9 +206,10 @@ def create_single_reopt_post(defaults, input_vals, main_output_folder, add_pv_pr
     Parameters
     ----------
     defaults : dict
-        Dictionary of template of default inputs. Unspecified values default to REopt defaults
-    input_vals : pandas DataFrame row
-        Row slice from pandas DataFrame Inputs
+        Dictionary of template of default inputs. Unspecified values default to REopt defaults.
+        Posts share the template's arrays, so pass it through `freeze_template` first.
+    input_vals : dict or pandas DataFrame row
+        Row of Inputs sheet
     main_output_folder : str
         folder path where REopt posts are saved.
     add_pv_prod_factor : bool
@@ -103,11 +220,19 @@ def create_single_reopt_post(defaults, input_vals, main_output_folder, add_pv_pr
         key to download solar proviles from PV watts.
     ochre_controls : dict
         optional dictionary of OCHRE building model output values (such as folder path).
+    ochre_outputs : list, optional
+        Already loaded `load_ochre_outputs(ochre_controls)`, which is not modified. Loaded from disk if not given.
+    column_plan : list, optional
+        `compile_column_plan` of the Inputs sheet columns. Compiled from `input_vals` if not given.
+    pretty_json : bool
+        If True then the post is saved indented for reading. Defaults to compact json.
+    float_digits : int, optional
+        If given then floats in the post are rounded to this many significant digits.
     """
     # print(f"Creating REopt post {input_vals['post_name']}")
     pathlib.Path(main_output_folder).mkdir(parents=True, exist_ok=True)
     
-    post = copy.deepcopy(defaults)
+    post = copy_template(defaults)
     file_name = input_vals["post_name"] + ".json"
     
     if add_pv_prod_factor:
@@ -122,7 +247,8 @@ def create_single_reopt_post(defaults, input_vals, main_output_folder, add_pv_pr
     #Load ochre outputs
     if ochre_controls["use_ochre_outputs"]:
         try:
-            ochre_outputs = load_ochre_outputs(ochre_controls)
+            if ochre_outputs is None:
+                ochre_outputs = load_ochre_outputs(ochre_controls)
             #If OCHRE run fails then ochre_outputs will be []. In this case don't add OCHRE values
             parsed_prop, a_matrix, b_matrix, hourly_inputs, a_matrix_wh, b_matrix_wh = ochre_outputs
             # post["Scenario"]["description"] = building_metadata
@@ -136,8 +262,7 @@ def create_single_reopt_post(defaults, input_vals, main_output_folder, add_pv_pr
             if "HVAC" in input_vals and not_none(input_vals["WH"]):
                 hvac_post(post, ochre_outputs, ochre_controls) #hvac_lower_bound, hvac_upper_bound, hvac_comfort_lower_bound, hvac_comfort_upper_bound)
         except Exception as e:
-            print(f"OCHRE outputs failed for {input_vals['output_subfolder']} post {input_vals['post_name']} due to {e}")
-            return None
+            raise Exception(f"OCHRE outputs failed due to {e}") from e
                 
     #Output subfolder allows for folder structure for REopt posts
     if "output_subfolder" in input_vals and not_none(input_vals["output_subfolder"]):
@@ -146,30 +271,104 @@ def create_single_reopt_post(defaults, input_vals, main_output_folder, add_pv_pr
     else:
         output_folder = main_output_folder
     
-    for name, val in input_vals.iteritems():
-        update_post(post, name, val)
+    if column_plan is None:
+        column_plan = compile_column_plan(list(input_vals.keys()))
+    apply_column_plan(post, column_plan, input_vals)
         
-    with open(os.path.join(output_folder, file_name), "w") as fp:
-        json.dump(post, fp, indent = 2)
+    save_post(post, output_folder, file_name, pretty_json, float_digits)
         
     
-def update_post(post, name, val):
-    """Parses input value to REopt post"""
+def freeze_template(val):
+    """
+    Return copy of post template `val` with arrays made tuples, so that posts can share them without being able to modify them
+
+    Lists holding dicts (or such lists) stay lists, which `copy_template` copies for every post along with their dicts.
+    """
+    if isinstance(val, dict):
+        return {k: freeze_template(v) for k, v in val.items()}
+    elif isinstance(val, (list, tuple)):
+        frozen = [freeze_template(v) for v in val]
+        if any(isinstance(v, (dict, list)) for v in frozen):
+            return frozen
+        return tuple(frozen)
+    return val
+
+
+def copy_template(template):
+    """
+    Return copy-on-write copy of frozen post `template`
+
+    Only the nested dicts, and lists of them, are copied, so values set on the post (as `update_post` and the OCHRE
+    post builders do) never reach the template. Arrays and values are shared with the template
+    rather than deep copied for every post.
+    """
+    if isinstance(template, dict):
+        return {k: copy_template(v) for k, v in template.items()}
+    elif isinstance(template, list):
+        return [copy_template(v) for v in template]
+    return template
+
+
+# Inputs sheet columns which control post creation rather than setting post values
+SKIP_COLUMNS = ["post_name", "output_subfolder", "ochre_folder", "load_file", "solar_production_factor_file", "WH", "HVAC"]
+
 
-    if val != val:   #Checks if is nan
-        pass
+def column_path(name):
+    """Return path of keys in the post that Inputs sheet column `name` sets, or None if the column is skipped"""
+    if name in SKIP_COLUMNS:
+        return None
+    elif "ScenarioLevel|" in name:
+        return ("Scenario", name.replace("ScenarioLevel|", ""))
+    elif "|" in name:
+        upper_level, lower_variable = name.split("|")
+        return ("Scenario", "Site", upper_level, lower_variable)
     else:
-        if type(val) is np.int64:
-            val = int(val)
-        if name in ["post_name", "output_subfolder", "ochre_folder", "load_file", "solar_production_factor_file", "WH", "HVAC"]:
-            pass
-        elif "ScenarioLevel|" in name:
-            name_sub = name.replace("ScenarioLevel|", "")
-            post["Scenario"][name_sub] = val
-        elif "|" in name:
-            upper_level, lower_variable = name.split("|")
-            if upper_level not in post["Scenario"]["Site"]:
-                post["Scenario"]["Site"][upper_level] = {}
-            post["Scenario"]["Site"][upper_level][lower_variable] = val
+        return ("Scenario", name)
+
+
+def to_python(val):
+    """Return numpy scalar `val` as the equivalent python value"""
+    if isinstance(val, np.generic):
+        return val.item()
+    return val
+
+
+def compile_column_plan(columns, dtypes = None):
+    """
+    Return list of (column name, post path, conversion) for the Inputs sheet `columns` which set post values
+
+    The plan is compiled once per Inputs sheet and applied to every row with `apply_column_plan`.
+    `dtypes` is an optional list of the columns' dtypes, used to pick the conversion of each column.
+    """
+    plan = []
+    for i, name in enumerate(columns):
+        path = column_path(name)
+        if path is None:
+            continue
+        if dtypes is not None and pd.api.types.is_integer_dtype(dtypes[i]):
+            convert = int
+        elif dtypes is not None and pd.api.types.is_float_dtype(dtypes[i]):
+            convert = float
         else:
-            post["Scenario"][name] = val
\ No newline at end of file
+            convert = to_python
+        plan.append((name, path, convert))
+    return plan
+
+
+def apply_column_plan(post, plan, input_vals):
+    """Set post values from `input_vals` (dictionary or Series of one Inputs sheet row) following compiled `plan`. Blank (nan) values are skipped."""
+    for name, path, convert in plan:
+        val = input_vals[name]
+        if val != val:   #Checks if is nan
+            continue
+        section = post
+        for key in path[:-1]:
+            if key not in section:
+                section[key] = {}
+            section = section[key]
+        section[path[-1]] = convert(val)
+
+
+def update_post(post, name, val):
+    """Parses input value to REopt post"""
+    apply_column_plan(post, compile_column_plan([name]), {name: val})
@@ -0,0 +1,165 @@
+"""
+Binary sidecar of the OCHRE outputs used to create REopt posts
+
+Parsing the OCHRE matrix csvs and OCHRE_Run.csv takes seconds per building, every time
+posts are created. The first time `load_ochre_outputs` reads a building it saves the frames
+it parsed as .npy arrays in a `SIDECAR_FOLDER` subfolder of the building's OCHRE output
+folder, with a json header of row and column names. Later loads memory map the arrays
+instead of parsing the csvs, as long as the header is newer than all of the csvs.
+
+`run_ochre` writes the sidecar after each building is simulated. Sidecars for an existing
+OCHRE outputs folder can be built ahead of post creation with
+    nova_ochre_sidecar OCHRE --ochre_inputs_main_folder ResStock
+
+With the "reopt" OCHRE output profile (or `--compact`) the wide hourly csv is removed once the
+sidecar is written, and the sidecar becomes the building's hourly outputs.
+"""
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+SIDECAR_FOLDER = "reopt_sidecar"
+HEADER_FILE = "header.json"
+SIDECAR_VERSION = 1
+FRAMES = ["a_matrix", "b_matrix", "hourly_inputs", "a_matrix_wh", "b_matrix_wh"]
+
+
+def read_sidecar(ochre_output_file_path, source_files, hourly_columns, dtype = "float64"):
+    """
+    Return dictionary of OCHRE output frames from the sidecar in `ochre_output_file_path`
+
+    Returns None if there is no sidecar, it is older than any of `source_files`, or it was
+    written with a different `dtype` (any dtype is accepted if `dtype` is None) or from outputs
+    read with fewer of the named `hourly_columns` than the sidecar's hourly frame and
+    absent columns account for.
+    """
+    folder = os.path.join(ochre_output_file_path, SIDECAR_FOLDER)
+    header_file = os.path.join(folder, HEADER_FILE)
+    try:
+        header_time = os.path.getmtime(header_file)
+        if any(os.path.getmtime(f) > header_time for f in source_files):
+            return None
+        with open(header_file, "r") as fp:
+            header = json.load(fp)
+    except (OSError, ValueError):
+        return None
+    if header.get("version") != SIDECAR_VERSION or (dtype is not None and header.get("dtype") != dtype):
+        return None
+    try:
+        # Columns the csv did not have are recorded as absent, so they are not looked for again
+        covered = set(header["frames"]["hourly_inputs"]["columns"]).union(header.get("absent_columns", []))
+    except (KeyError, TypeError):
+        return None
+    if not set(hourly_columns).issubset(covered):
+        return None
+
+    frames = {}
+    try:
+        for name in FRAMES:
+            values = np.load(os.path.join(folder, name + ".npy"), mmap_mode="r")
+            index = header["frames"][name]["index"]
+            frames[name] = pd.DataFrame(values, index=index, columns=header["frames"][name]["columns"], copy=False)
+    except (OSError, ValueError, KeyError):
+        return None
+    return frames
+
+
+def write_sidecar(ochre_output_file_path, frames, hourly_columns, dtype = "float64"):
+    """
+    Save dictionary of OCHRE output `frames` as a sidecar in `ochre_output_file_path`
+
+    `hourly_columns` are the hourly columns that were asked for. The header records the columns the hourly
+    frame actually has, and those asked for which the outputs did not have as absent.
+    The header is removed first and written last, so an interrupted write leaves no sidecar rather than a corrupt one.
+    """
+    folder = os.path.join(ochre_output_file_path, SIDECAR_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    header_file = os.path.join(folder, HEADER_FILE)
+    if os.path.isfile(header_file):
+        os.remove(header_file)
+
+    columns = list(frames["hourly_inputs"].columns)
+    header = {"version": SIDECAR_VERSION, "dtype": dtype, "hourly_columns": columns,
+              "absent_columns": [col for col in dict.fromkeys(hourly_columns) if col not in columns], "frames": {}}
+    for name in FRAMES:
+        frame = frames[name]
+        np.save(os.path.join(folder, name + ".npy"), np.ascontiguousarray(frame.to_numpy(dtype=dtype if name == "hourly_inputs" else "float64")))
+        # The hourly frame has a plain range index, which is not stored
+        header["frames"][name] = {"index": None if name == "hourly_inputs" else list(frame.index), "columns": list(frame.columns)}
+
+    tmp = header_file + ".tmp"
+    with open(tmp, "w") as fp:
+        json.dump(header, fp)
+    os.replace(tmp, header_file)
+
+
+def compact_hourly_outputs(ochre_output_file_path, hourly_inputs_file):
+    """
+    Remove the wide OCHRE hourly outputs csv `hourly_inputs_file` of a building whose sidecar is up to date
+
+    `load_ochre_outputs` reads the sidecar when the csv is gone. Callers must first check the sidecar holds every
+    hourly column REopt posts need (see `ochre_support_functions.missing_hourly_columns`).
+    Returns bytes freed (0 if the sidecar is missing or older than the csv, in which case the csv is kept).
+    """
+    csv_path = os.path.join(ochre_output_file_path, hourly_inputs_file)
+    header_file = os.path.join(ochre_output_file_path, SIDECAR_FOLDER, HEADER_FILE)
+    if not os.path.isfile(csv_path) or not os.path.isfile(header_file) or os.path.getmtime(header_file) < os.path.getmtime(csv_path):
+        return 0
+    size = os.path.getsize(csv_path)
+    os.remove(csv_path)
+    return size
+
+
+def build_sidecars(ochre_controls, force = False, compact = False):
+    """
+    Write sidecars for every building folder in the OCHRE outputs main folder of `ochre_controls`
+
+    Existing up-to-date sidecars are kept unless `force` is True. If `compact` is True then each building's wide
+    hourly outputs csv is removed once its sidecar is written (see `compact_hourly_outputs`).
+    Returns number of buildings which failed.
+    """
+    # Imported here as ochre_support_functions imports this module
+    from novametrics.inputs.ochre_support_functions import load_ochre_outputs, get_output_file_keys, missing_hourly_columns
+    output_main_folder = ochre_controls.get("ochre_outputs_main_folder", "OCHRE")
+    n_failed, bytes_freed = 0, 0
+    hourly_inputs_key = get_output_file_keys(ochre_controls)["hourly_inputs"]
+    for building in sorted(os.listdir(output_main_folder)):
+        building_path = os.path.join(output_main_folder, building)
+        if not os.path.isdir(building_path):
+            continue
+        if force and os.path.isfile(os.path.join(building_path, SIDECAR_FOLDER, HEADER_FILE)):
+            os.remove(os.path.join(building_path, SIDECAR_FOLDER, HEADER_FILE))
+        try:
+            ochre_outputs = load_ochre_outputs(dict(ochre_controls, ochre_outputs_subfolder=building))
+            missing = missing_hourly_columns(ochre_outputs)
+            if compact and len(missing) > 0:
+                raise Exception(f"hourly outputs lack columns REopt posts need, so they were not compacted: {missing}")
+            if compact:
+                bytes_freed += sum(compact_hourly_outputs(building_path, f) for f in os.listdir(building_path) if f.endswith(hourly_inputs_key))
+        except Exception as e:
+            print(f"Sidecar for {building_path} failed due to {e}")
+            n_failed += 1
+    if compact:
+        print(f"Removed {bytes_freed/1e6:.1f} MB of OCHRE hourly csvs")
+    return n_failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write binary sidecars of OCHRE outputs for fast REopt post creation.")
+    parser.add_argument("ochre_outputs_main_folder", nargs="?", default="OCHRE", help="Folder of OCHRE building output subfolders.")
+    parser.add_argument("--ochre_inputs_main_folder", default="ResStock", help="Folder of OCHRE building input subfolders.")
+    parser.add_argument("--hourly_inputs_dtype", default="float64", help="Float type to store OCHRE hourly outputs as.")
+    parser.add_argument("--force", action="store_true", help="Rewrite sidecars even if they are up to date.")
+    parser.add_argument("--compact", action="store_true", help="Remove each building's wide hourly outputs csv once its sidecar is written.")
+    args = parser.parse_args()
+
+    ochre_controls = {"ochre_outputs_main_folder": args.ochre_outputs_main_folder, "ochre_inputs_main_folder": args.ochre_inputs_main_folder,
+                      "hourly_inputs_dtype": args.hourly_inputs_dtype}
+    n_failed = build_sidecars(ochre_controls, args.force, args.compact)
+    print(f"Finished writing sidecars. {n_failed} buildings failed.")
+
+
+if __name__ == "__main__":
+    main()
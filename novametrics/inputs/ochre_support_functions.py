@@ -4,7 +4,17 @@ import pandas as pd
 import yaml
 import xmltodict
 from novametrics.support.utils import load_post, not_none, get_dictionary_value, get_filename
+from novametrics.inputs.ochre_sidecar import read_sidecar, write_sidecar
 #%%
+# Named OCHRE hourly output columns used by hvac_post, wh_post and the post load profile.
+# RC node columns are taken from the matrix headers.
+HOURLY_INPUT_COLUMNS = ['Total Electric Power (kW)',
+                        'HVAC Heating Electric Power (kW)', 'HVAC Heating Delivered (kW)', 'HVAC Heating Fan Power (kW)',
+                        'HVAC Heating COP (-)', 'HVAC Heating ER Power (kW)', 'HVAC Heating Max Capacity (kW)',
+                        'HVAC Cooling Electric Power (kW)', 'HVAC Cooling Delivered (kW)', 'HVAC Cooling SHR (-)',
+                        'HVAC Cooling COP (-)', 'HVAC Cooling Max Capacity (kW)',
+                        'Water Heating Electric Power (kW)', 'Water Heating Delivered (kW)',
+                        'Water Heating Heat Pump COP (-)', 'Water Heating Heat Pump Max Capacity (kW)']
 
 def get_properties_file(file_path):
     """
@@ -312,6 +322,60 @@ def parse_properties(file_path):
 
     return out
 
+def read_hourly_inputs(file_path, node_columns, ochre_controls = {}):
+    """
+    Read only the OCHRE hourly output columns needed for REopt posts
+
+    Reads `HOURLY_INPUT_COLUMNS` and `node_columns` (the RC matrix node names) as floats, skipping the
+    rest of the (at high verbosity, hundreds of) columns. Columns missing from the file are skipped.
+    `ochre_controls` can set *csv_engine* ("c" or "pyarrow", defaults to "c") and *hourly_inputs_dtype*
+    ("float64" or "float32", defaults to "float64").
+    """
+    engine = get_dictionary_value(ochre_controls, "csv_engine", "c")
+    dtype = get_dictionary_value(ochre_controls, "hourly_inputs_dtype", "float64")
+    if engine == "pyarrow":
+        try:
+            import pyarrow
+        except ImportError:
+            print("pyarrow is not installed. Reading OCHRE outputs with the default csv engine.")
+            engine = "c"
+    
+    header = pd.read_csv(file_path, nrows=0).columns
+    needed = set(HOURLY_INPUT_COLUMNS).union(node_columns)
+    usecols = [col for col in header if col in needed]
+    return pd.read_csv(file_path, usecols=usecols, dtype={col: dtype for col in usecols}, engine=engine)
+
+
+# OCHRE output files `load_ochre_outputs` reads, as the `ochre_controls` setting naming each file and the default file name ending
+OUTPUT_FILE_KEYS = {"envelope_matrixA": "_Envelope_matrixA.csv", "envelope_matrixB": "_Envelope_matrixB.csv", "hourly_inputs": "OCHRE_Run.csv",
+                    "water_tank_matrixA": "_Water Tank_matrixA.csv", "water_tank_matrixB": "_Water Tank_matrixB.csv"}
+
+
+def get_output_file_keys(ochre_controls):
+    """Return dictionary of each of `OUTPUT_FILE_KEYS` to the file name ending set in `ochre_controls`, or its default"""
+    return {name: get_dictionary_value(ochre_controls, name, default) for name, default in OUTPUT_FILE_KEYS.items()}
+
+
+def missing_hourly_columns(ochre_outputs):
+    """
+    Return list of hourly output columns `hvac_post` and `wh_post` need for the building of `ochre_outputs` (from
+    `load_ochre_outputs`) which its hourly outputs lack, such as RC node columns missing at low OCHRE verbosity
+    """
+    parsed_prop, a_matrix, b_matrix, hourly_inputs, a_matrix_wh, b_matrix_wh = ochre_outputs
+    needed = list(a_matrix.keys()) + list(b_matrix.keys()) + ['HVAC Heating Electric Power (kW)', 'HVAC Heating Delivered (kW)', 'HVAC Heating Max Capacity (kW)']
+    if parsed_prop['heating fuel'] == "Electricity":
+        needed += ['HVAC Heating COP (-)']
+    else:
+        needed += ['HVAC Heating Fan Power (kW)']
+    if parsed_prop['cooling fuel'] == "Electricity":
+        needed += ['HVAC Cooling SHR (-)', 'HVAC Cooling COP (-)', 'HVAC Cooling Max Capacity (kW)', 'HVAC Cooling Electric Power (kW)', 'HVAC Cooling Delivered (kW)']
+    if (parsed_prop["water heater fuel"] != "None") and ((parsed_prop["erwh_size_kw"] + parsed_prop["hpwh_size_kw"]) > 0.01):
+        needed += list(a_matrix_wh.keys()) + list(b_matrix_wh.keys()) + ['Water Heating Electric Power (kW)', 'Water Heating Delivered (kW)']
+        if parsed_prop["hpwh_size_kw"] > 0.01:
+            needed += ['Water Heating Heat Pump COP (-)', 'Water Heating Heat Pump Max Capacity (kW)']
+    return [col for col in dict.fromkeys(needed) if col not in hourly_inputs.columns]
+
+
 def load_ochre_outputs(ochre_controls):
     """
     Return list of OCHRE building model output results.
@@ -329,6 +393,9 @@ def load_ochre_outputs(ochre_controls):
          hourly_inputs - OCHRE_Run.csv
          water_tank_matrixA - _Water Tank_matrixA.csv
          water_tank_matrixB - _Water Tank_matrixB.csv
+     Outputs are read from the binary sidecar (see `ochre_sidecar`) when it is up to date, and the
+     sidecar is written after reading the csvs unless *ochre_sidecar* is False. If the hourly csv was removed
+     by the "reopt" output profile then the sidecar is read whatever *ochre_sidecar* is.
     
     Returns
     -------
@@ -342,26 +409,49 @@ def load_ochre_outputs(ochre_controls):
     ochre_input_file_path = os.path.join(input_main_folder, ochre_controls["ochre_outputs_subfolder"])    
     ochre_output_file_path = os.path.join(ochre_controls["ochre_outputs_main_folder"], ochre_controls["ochre_outputs_subfolder"])    
     properties_file_key = get_dictionary_value(ochre_controls, "properties_file", "in.yaml").rsplit(".", 1)[0] + ".yaml"
-    envelope_matrixA_key = get_dictionary_value(ochre_controls, "envelope_matrixA", "_Envelope_matrixA.csv")
-    envelope_matrixB_key = get_dictionary_value(ochre_controls, "envelope_matrixB", "_Envelope_matrixB.csv")
-    hourly_inputs_key = get_dictionary_value(ochre_controls, "hourly_inputs", "OCHRE_Run.csv")
-    water_tank_matrixA_key = get_dictionary_value(ochre_controls, "water_tank_matrixA", "_Water Tank_matrixA.csv")
-    water_tank_matrixB_key = get_dictionary_value(ochre_controls, "water_tank_matrixB", "_Water Tank_matrixB.csv")
+    output_file_keys = get_output_file_keys(ochre_controls)
 
     xml_file = get_filename(ochre_input_file_path, xml_properties_ext)
     properties_file = get_filename(ochre_input_file_path, properties_file_key)           
-    b_matrix_file = get_filename(ochre_output_file_path, envelope_matrixB_key)
-    a_matrix_file = get_filename(ochre_output_file_path, envelope_matrixA_key)
-    hourly_inputs_file = get_filename(ochre_output_file_path, hourly_inputs_key)
-    a_matrix_wh_file = get_filename(ochre_output_file_path, water_tank_matrixA_key)
-    b_matrix_wh_file = get_filename(ochre_output_file_path, water_tank_matrixB_key)
+    b_matrix_file = get_filename(ochre_output_file_path, output_file_keys["envelope_matrixB"])
+    a_matrix_file = get_filename(ochre_output_file_path, output_file_keys["envelope_matrixA"])
+    try:
+        hourly_inputs_file = get_filename(ochre_output_file_path, output_file_keys["hourly_inputs"])
+    except Exception:
+        # Compacted outputs (see `ochre_sidecar.compact_hourly_outputs`) keep only the sidecar
+        hourly_inputs_file = None
+    a_matrix_wh_file = get_filename(ochre_output_file_path, output_file_keys["water_tank_matrixA"])
+    b_matrix_wh_file = get_filename(ochre_output_file_path, output_file_keys["water_tank_matrixB"])
     
     parsed_prop = parse_properties(os.path.join(ochre_input_file_path, properties_file))
+    
+    # Prefer the binary sidecar of previously parsed outputs if it is newer than the csvs
+    use_sidecar = str(get_dictionary_value(ochre_controls, "ochre_sidecar", True)).lower() not in ["false", "0", "no"]
+    dtype = get_dictionary_value(ochre_controls, "hourly_inputs_dtype", "float64")
+    source_files = [os.path.join(ochre_output_file_path, f) for f in [a_matrix_file, b_matrix_file, hourly_inputs_file, a_matrix_wh_file, b_matrix_wh_file] if f is not None]
+    if hourly_inputs_file is None:
+        # The sidecar is all there is, so it is used whatever columns it has
+        frames = read_sidecar(ochre_output_file_path, source_files, [], None)
+        if frames is None:
+            raise Exception(f"No OCHRE hourly outputs in {ochre_output_file_path}. Neither a file ending in {output_file_keys['hourly_inputs']} nor an up to date sidecar was found.")
+        frames["hourly_inputs"] = frames["hourly_inputs"].astype(dtype, copy=False)
+        return [parsed_prop, frames["a_matrix"], frames["b_matrix"], frames["hourly_inputs"], frames["a_matrix_wh"], frames["b_matrix_wh"]]
+    frames = read_sidecar(ochre_output_file_path, source_files, HOURLY_INPUT_COLUMNS, dtype) if use_sidecar else None
+    if frames is not None:
+        return [parsed_prop, frames["a_matrix"], frames["b_matrix"], frames["hourly_inputs"], frames["a_matrix_wh"], frames["b_matrix_wh"]]
+    
     a_matrix = pd.read_csv(os.path.join(ochre_output_file_path, a_matrix_file), index_col=0)
     b_matrix = pd.read_csv(os.path.join(ochre_output_file_path, b_matrix_file), index_col=0)
-    hourly_inputs = pd.read_csv(os.path.join(ochre_output_file_path, hourly_inputs_file))
     a_matrix_wh = pd.read_csv(os.path.join(ochre_output_file_path, a_matrix_wh_file), index_col=0)
     b_matrix_wh = pd.read_csv(os.path.join(ochre_output_file_path, b_matrix_wh_file), index_col=0)
+    node_columns = list(a_matrix.keys()) + list(b_matrix.keys()) + list(a_matrix_wh.keys()) + list(b_matrix_wh.keys())
+    hourly_inputs = read_hourly_inputs(os.path.join(ochre_output_file_path, hourly_inputs_file), node_columns, ochre_controls)
+    if use_sidecar:
+        try:
+            write_sidecar(ochre_output_file_path, {"a_matrix": a_matrix, "b_matrix": b_matrix, "hourly_inputs": hourly_inputs,
+                                                   "a_matrix_wh": a_matrix_wh, "b_matrix_wh": b_matrix_wh}, HOURLY_INPUT_COLUMNS + node_columns, dtype)
+        except OSError as e:
+            print(f"Could not write OCHRE sidecar to {ochre_output_file_path} due to {e}")
 
     # building_metadata = get_building_metadata(os.path.join(ochre_input_file_path, xml_file), os.path.join(ochre_input_file_path, properties_file))
     return [parsed_prop, a_matrix, b_matrix, hourly_inputs, a_matrix_wh, b_matrix_wh]
@@ -371,6 +461,64 @@ def load_ochre_outputs(ochre_controls):
     
 
 
+def flatten_columns(matrix, digits = None):
+    """
+    Return list of DataFrame or 2D array `matrix` values column by column, the order REopt expects RC matrices and inputs in
+
+    If `digits` is given then values are rounded to that many significant digits (see `round_significant`).
+    """
+    return round_significant(matrix, digits).ravel(order='F').tolist()
+
+
+def round_significant(values, digits = None):
+    """
+    Return array of `values` rounded to `digits` significant digits, or unchanged if `digits` is None
+
+    Values are rounded by scaling with exact powers of ten, so each rounded value is the float
+    closest to its short decimal and is written to json with at most `digits` digits.
+    The few values too small or large to scale exactly are rounded through string formatting instead.
+    """
+    values = np.asarray(values, dtype=float)
+    if digits is None:
+        return values
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        exponent = np.floor(np.log10(np.abs(values)))
+        decimals = digits - 1 - np.where(np.isfinite(exponent), exponent, 0)
+        scale = 10.0 ** np.abs(np.clip(decimals, -22, 22))
+        rounded = np.where(decimals >= 0, np.round(values * scale) / scale, np.round(values / scale) * scale)
+    unscaled = np.abs(decimals) > 22
+    if unscaled.any():
+        rounded[unscaled] = [float(f"{v:.{digits - 1}e}") for v in values[unscaled]]
+    return rounded
+
+
+# OCHRE sheet settings of the significant digits RC and HotWaterTank arrays are written with, and the post section and field each applies to.
+# Unset fields are written at full precision.
+ARRAY_DIGITS_SETTINGS = {"rc_a_matrix_digits": ("RC", "a_matrix"), "rc_b_matrix_digits": ("RC", "b_matrix"), "rc_u_inputs_digits": ("RC", "u_inputs"),
+                         "wh_a_matrix_digits": ("HotWaterTank", "a_matrix"), "wh_b_matrix_digits": ("HotWaterTank", "b_matrix"),
+                         "wh_u_inputs_digits": ("HotWaterTank", "u_inputs")}
+
+
+def get_array_digits(ochre_controls, name):
+    """Return significant digits set for array setting `name` in `ochre_controls` as int, or None if not set"""
+    digits = get_dictionary_value(ochre_controls, name, None)
+    return None if digits is None else int(digits)
+
+
+def quantize_post(post, ochre_controls):
+    """Round the RC and HotWaterTank arrays already in `post` to the significant digits set in `ochre_controls`"""
+    for name, (section, field) in ARRAY_DIGITS_SETTINGS.items():
+        digits = get_array_digits(ochre_controls, name)
+        if digits is not None and field in post['Scenario']['Site'].get(section, {}):
+            post['Scenario']['Site'][section][field] = round_significant(post['Scenario']['Site'][section][field], digits).tolist()
+    return post
+
+
+def subtract_load(loads_kw, load):
+    """Return list of `loads_kw` minus array `load`, over the length of `load`"""
+    return (np.asarray(loads_kw[:len(load)], dtype=float) - load).tolist()
+
+
 def wh_post(post, ochre_outputs, ochre_controls):
     parsed_prop, a_matrix, b_matrix, hourly_inputs, a_matrix_wh, b_matrix_wh = ochre_outputs
     erwh_size_kw = parsed_prop["erwh_size_kw"]
@@ -389,15 +537,15 @@ def wh_post(post, ochre_outputs, ochre_controls):
         wh_temperature_lower_bound = get_dictionary_value(ochre_controls, "wh_temperature_lower_bound", 30)
         wh_temperature_upper_bound = get_dictionary_value(ochre_controls, "wh_temperature_upper_bound", 60)
         wh_comfort_temp_limit = get_dictionary_value(ochre_controls, "wh_comfort_temp_limit", 43)
-        wh_load = list(hourly_inputs.loc[:, 'Water Heating Electric Power (kW)'])
-        post['Scenario']['Site']['LoadProfile']['loads_kw'] = [post['Scenario']['Site']['LoadProfile']['loads_kw'][i] - wh_load[i] for i in range(len(wh_load))]
+        wh_load = hourly_inputs.loc[:, 'Water Heating Electric Power (kW)'].to_numpy()
+        post['Scenario']['Site']['LoadProfile']['loads_kw'] = subtract_load(post['Scenario']['Site']['LoadProfile']['loads_kw'], wh_load)
 
         init_temperatures_wh = hourly_inputs.loc[:, a_matrix_wh.keys()]
         init_temperatures_wh = list(init_temperatures_wh.iloc[0])
         
         if hpwh_size_kw > 0.01:
-            hpwh_cop = list(hourly_inputs.loc[:, 'Water Heating Heat Pump COP (-)'])
-            hpwh_prodfactor = list(hourly_inputs.loc[:, 'Water Heating Heat Pump Max Capacity (kW)'] / hpwh_size_kw)
+            hpwh_cop = hourly_inputs.loc[:, 'Water Heating Heat Pump COP (-)'].tolist()
+            hpwh_prodfactor = (hourly_inputs.loc[:, 'Water Heating Heat Pump Max Capacity (kW)'].to_numpy() / hpwh_size_kw).tolist()
         else:
             hpwh_cop = []
             hpwh_prodfactor = []
@@ -408,12 +556,12 @@ def wh_post(post, ochre_outputs, ochre_controls):
         wh_injection_node_num = b_matrix_wh.columns.get_loc('H_WH1') + 1
         water_node_num = a_matrix_wh.columns.get_loc('T_WH1') + 1
     
-        u_inputs_wh = hourly_inputs.loc[:, b_matrix_wh.keys()]
-        u_inputs_wh.loc[:, 'H_WH1'] = u_inputs_wh.loc[:, 'H_WH1'] - hourly_inputs.loc[:, 'Water Heating Delivered (kW)'] * 1000
+        u_inputs_wh = hourly_inputs.loc[:, b_matrix_wh.keys()].to_numpy(dtype=float, copy=True)  # copy, so hourly_inputs is not modified
+        u_inputs_wh[:, wh_injection_node_num - 1] -= hourly_inputs.loc[:, 'Water Heating Delivered (kW)'].to_numpy() * 1000
                                                     
-        a_matrix_wh = list(a_matrix_wh.T.stack().reset_index(name='new')['new'])
-        b_matrix_wh = list(b_matrix_wh.T.stack().reset_index(name='new')['new'])
-        u_inputs_wh = list(u_inputs_wh.T.stack().reset_index(name='new')['new'])
+        a_matrix_wh = flatten_columns(a_matrix_wh, get_array_digits(ochre_controls, "wh_a_matrix_digits"))
+        b_matrix_wh = flatten_columns(b_matrix_wh, get_array_digits(ochre_controls, "wh_b_matrix_digits"))
+        u_inputs_wh = flatten_columns(u_inputs_wh, get_array_digits(ochre_controls, "wh_u_inputs_digits"))
         
         if 'HotWaterTank' not in post['Scenario']['Site']:
             post['Scenario']['Site']['HotWaterTank'] = {}
@@ -463,23 +611,22 @@ def hvac_post(post, ochre_outputs, ochre_controls):
 
     
     if parsed_prop['heating fuel'] == "Electricity":
-        hp_cop = list(hourly_inputs.loc[:, 'HVAC Heating COP (-)'])
-        try:
-            er_on = hourly_inputs.loc[:, 'HVAC Heating ER Power (kW)']
-        except:
-            er_on = pd.Series([-1]*n_timesteps)
+        hp_cop = hourly_inputs.loc[:, 'HVAC Heating COP (-)'].tolist()
+        if 'HVAC Heating ER Power (kW)' in hourly_inputs:
+            er_on = hourly_inputs.loc[:, 'HVAC Heating ER Power (kW)'].to_numpy()
+        else:
+            er_on = np.full(n_timesteps, -1.0)
     else:
         constant_heating_cop = get_fan_adjustment(hourly_inputs.loc[:, 'HVAC Heating Delivered (kW)'], hourly_inputs.loc[:, 'HVAC Heating Fan Power (kW)'])
         hp_cop = [constant_heating_cop/parsed_prop["ac_dse"]]*n_timesteps
-        er_on = pd.Series([-1]*n_timesteps) 
+        er_on = np.full(n_timesteps, -1.0)
         
     if parsed_prop['cooling fuel'] == "Electricity":
-        ac_shr = list(hourly_inputs.loc[:, 'HVAC Cooling SHR (-)'])
+        ac_shr = hourly_inputs.loc[:, 'HVAC Cooling SHR (-)'].tolist()
         if "FlexTechAC" not in post['Scenario']['Site']:
             post['Scenario']['Site']["FlexTechAC"] = {}
-        ac_cop = list(hourly_inputs.loc[:, 'HVAC Cooling COP (-)'])
-        ac_prodfactor = hourly_inputs.loc[:, 'HVAC Cooling Max Capacity (kW)'] / parsed_prop["ac_size_heat"]
-        ac_prodfactor = list(ac_prodfactor)
+        ac_cop = hourly_inputs.loc[:, 'HVAC Cooling COP (-)'].tolist()
+        ac_prodfactor = (hourly_inputs.loc[:, 'HVAC Cooling Max Capacity (kW)'].to_numpy() / parsed_prop["ac_size_heat"]).tolist()
         post['Scenario']['Site']['FlexTechAC']['min_kw'] = parsed_prop["ac_size_kw"]
         post['Scenario']['Site']['FlexTechAC']['max_kw'] = parsed_prop["ac_size_kw"]
         post['Scenario']['Site']['FlexTechAC']['shr'] = ac_shr
@@ -487,29 +634,29 @@ def hvac_post(post, ochre_outputs, ochre_controls):
         post['Scenario']['Site']['FlexTechAC']['cop'] = ac_cop
         post['Scenario']['Site']['FlexTechAC']['dse'] = parsed_prop["ac_dse"]
         post['Scenario']['Site']['FlexTechAC']['fan_power_ratio'] = parsed_prop["ac_fan_power_ratio"]
-        cooling_hourly_loads = hourly_inputs.loc[:, 'HVAC Cooling Electric Power (kW)']
-        cooling_delivered = hourly_inputs.loc[:, 'HVAC Cooling Delivered (kW)'] * 1000
+        cooling_hourly_loads = hourly_inputs.loc[:, 'HVAC Cooling Electric Power (kW)'].to_numpy()
+        cooling_delivered = hourly_inputs.loc[:, 'HVAC Cooling Delivered (kW)'].to_numpy() * 1000
     else:
-        cooling_hourly_loads = pd.Series([0]*n_timesteps) 
-        cooling_delivered = pd.Series([0]*n_timesteps)
+        cooling_hourly_loads = np.zeros(n_timesteps)
+        cooling_delivered = np.zeros(n_timesteps)
         
-    hvac_load = hourly_inputs.loc[:, 'HVAC Heating Electric Power (kW)'] + cooling_hourly_loads
+    hvac_load = hourly_inputs.loc[:, 'HVAC Heating Electric Power (kW)'].to_numpy() + cooling_hourly_loads
     # HVAC RC characteristics    
     n_temp_nodes_hvac = a_matrix.shape[1]
     n_input_nodes_hvac = b_matrix.shape[1]
     hvac_injection_node_num = b_matrix.columns.get_loc('H_LIV') + 1
     space_node_num = a_matrix.columns.get_loc('T_LIV') + 1
     
-    u_inputs = hourly_inputs.loc[:, b_matrix.keys()]
-    u_inputs.loc[:, 'H_LIV'] = u_inputs.loc[:, 'H_LIV'] + cooling_delivered - hourly_inputs.loc[:, 'HVAC Heating Delivered (kW)'] * 1000
+    u_inputs = hourly_inputs.loc[:, b_matrix.keys()].to_numpy(dtype=float, copy=True)  # copy, so hourly_inputs is not modified
+    u_inputs[:, hvac_injection_node_num - 1] = u_inputs[:, hvac_injection_node_num - 1] + cooling_delivered - hourly_inputs.loc[:, 'HVAC Heating Delivered (kW)'].to_numpy() * 1000
     # Convert matrices to lists for API input
-    a_matrix = list(a_matrix.T.stack().reset_index(name='new')['new'])
-    b_matrix = list(b_matrix.T.stack().reset_index(name='new')['new'])
-    u_inputs = list(u_inputs.T.stack().reset_index(name='new')['new'])                                                
+    a_matrix = flatten_columns(a_matrix, get_array_digits(ochre_controls, "rc_a_matrix_digits"))
+    b_matrix = flatten_columns(b_matrix, get_array_digits(ochre_controls, "rc_b_matrix_digits"))
+    u_inputs = flatten_columns(u_inputs, get_array_digits(ochre_controls, "rc_u_inputs_digits"))
 
     #    
     
-    hp_prodfactor = hourly_inputs.loc[:, 'HVAC Heating Max Capacity (kW)'] / parsed_prop["hp_size_heat"]
+    hp_prodfactor = hourly_inputs.loc[:, 'HVAC Heating Max Capacity (kW)'].to_numpy() / parsed_prop["hp_size_heat"]
 
     # Zero out prodfactors where necessary to ensure heating and cooling cannot occur simultaneously
 #        space_cond = u_inputs.loc[:, hvac_injection_node_col]
@@ -517,7 +664,7 @@ def hvac_post(post, ochre_outputs, ochre_controls):
 #        hp_prodfactor[space_cond > 500] = 0.01
     hp_prodfactor[er_on > 0] = 5.0
 
-    hp_prodfactor = list(hp_prodfactor)
+    hp_prodfactor = hp_prodfactor.tolist()
     
 
     if "RC" not in post['Scenario']['Site']:
@@ -527,7 +674,7 @@ def hvac_post(post, ochre_outputs, ochre_controls):
     if "FlexTechFP" not in post['Scenario']['Site']:
         post['Scenario']['Site']["FlexTechHP"] = {}
     
-    post['Scenario']['Site']['LoadProfile']['loads_kw'] = [post['Scenario']['Site']['LoadProfile']['loads_kw'][i] - hvac_load[i] for i in range(len(hvac_load))]
+    post['Scenario']['Site']['LoadProfile']['loads_kw'] = subtract_load(post['Scenario']['Site']['LoadProfile']['loads_kw'], hvac_load)
     post['Scenario']['Site']['RC']['use_flexloads_model'] = True
     post['Scenario']['Site']['RC']['a_matrix'] = a_matrix
     post['Scenario']['Site']['RC']['b_matrix'] = b_matrix
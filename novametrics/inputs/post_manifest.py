@@ -0,0 +1,109 @@
+"""
+Fingerprint manifest of created REopt posts
+
+For each post, the manifest records a fingerprint of everything the post was built from:
+its Inputs sheet row, the default post template, the PV production factor file, the load
+file and the OCHRE input and output files of its building. Files are fingerprinted by size
+and modification time, so checking a post does not read its sources. `create_reopt_posts`
+only rewrites posts which are missing or whose fingerprint changed.
+
+The manifest is saved next to the posts folder as `<reopt_posts>_manifest.json`, so that it
+is not mistaken for a post.
+"""
+import os
+import json
+import hashlib
+from novametrics.support.result_cache import normalize
+from novametrics.support.utils import not_none, get_dictionary_value
+from novametrics.inputs.reopt_post_support_functions import get_pv_prod_factor_path
+from novametrics.inputs.ochre_support_functions import OUTPUT_FILE_KEYS, ARRAY_DIGITS_SETTINGS
+
+# Values of `ochre_controls` which change what goes into a post. Settings such as worker counts,
+# csv reading engine and OCHRE output profile do not, so changing them does not rewrite posts.
+OCHRE_POST_KEYS = ["use_ochre_outputs", "ochre_inputs_main_folder", "ochre_outputs_main_folder", "ochre_outputs_subfolder", "properties_file",
+                   "hourly_inputs_dtype", "hvac_temperature_lower_bound", "hvac_temperature_upper_bound", "hvac_comfort_temp_lower_bound",
+                   "hvac_comfort_temp_upper_bound", "wh_temperature_lower_bound", "wh_temperature_upper_bound",
+                   "wh_comfort_temp_limit"] + list(OUTPUT_FILE_KEYS) + list(ARRAY_DIGITS_SETTINGS)
+
+
+def manifest_file(main_output_folder):
+    return os.path.normpath(main_output_folder) + "_manifest.json"
+
+
+def hash_value(val):
+    """Return sha256 hex digest of canonical json of `val`"""
+    canonical = json.dumps(normalize(val), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(path):
+    """Return size and modification time of file at `path`, or "missing" if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "missing"
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def folder_fingerprint(folder):
+    """Return dictionary of file name to `file_fingerprint` of each file directly in `folder`"""
+    try:
+        return {entry.name: file_fingerprint(entry.path) for entry in os.scandir(folder) if entry.is_file()}
+    except OSError:
+        return "missing"
+
+
+def post_fingerprint(input_vals, template_hash, ochre_controls, add_pv_prod_factor, solar_profile_folder, defaults, float_digits = None):
+    """
+    Return fingerprint of the sources post of `input_vals` is created from, including the `OCHRE_POST_KEYS` values of
+    `ochre_controls` and the `float_digits` floats are rounded to when the post is saved
+    """
+    sources = {"row": input_vals, "template": template_hash}
+    if float_digits is not None:
+        sources["float_digits"] = float_digits
+    if add_pv_prod_factor:
+        sources["pv_prod_factor"] = file_fingerprint(get_pv_prod_factor_path(input_vals, solar_profile_folder, defaults))
+    if ("load_file" in input_vals) and not_none(input_vals["load_file"]):
+        sources["load_file"] = file_fingerprint(input_vals["load_file"])
+    if ochre_controls.get("use_ochre_outputs"):
+        subfolder = ochre_controls["ochre_outputs_subfolder"]
+        sources["ochre_controls"] = {k: ochre_controls[k] for k in OCHRE_POST_KEYS if k in ochre_controls}
+        sources["ochre_inputs"] = folder_fingerprint(os.path.join(get_dictionary_value(ochre_controls, "ochre_inputs_main_folder", "ResStock"), subfolder))
+        sources["ochre_outputs"] = folder_fingerprint(os.path.join(ochre_controls["ochre_outputs_main_folder"], subfolder))
+    return hash_value(sources)
+
+
+class PostManifest:
+    """
+    Manifest of post fingerprints saved to `manifest_path`
+
+    Fingerprints are keyed by post path relative to the posts folder. The posts set in this
+    run are saved as "changed", so later steps can tell which posts were rewritten.
+    """
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.fingerprints = {}
+        self.changed = []
+        if os.path.isfile(manifest_path):
+            try:
+                with open(manifest_path, "r") as fp:
+                    self.fingerprints = json.load(fp)["posts"]
+            except (ValueError, KeyError):
+                print(f"Could not read post manifest {manifest_path}. All posts will be created.")
+
+    def is_current(self, post_key, fingerprint, post_path):
+        """Return True if post at `post_path` exists and was created from sources with `fingerprint`"""
+        return self.fingerprints.get(post_key) == fingerprint and os.path.isfile(post_path)
+
+    def set(self, post_key, fingerprint):
+        self.fingerprints[post_key] = fingerprint
+        self.changed.append(post_key)
+
+    def remove(self, post_key):
+        self.fingerprints.pop(post_key, None)
+
+    def save(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump({"changed": sorted(self.changed), "posts": self.fingerprints}, fp, indent=0, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
@@ -16,8 +16,8 @@ def get_pv_prod_factor(input_vals, solar_profile_folder, post, pv_watts_api_key)
 
     Parameters
     ----------
-    input_vals : pandas data frame row slice
-        Single row of pandas data frame of inputs.
+    input_vals : dict or pandas data frame row slice
+        Single row of inputs.
     solar_profile_folder : str
         string to solar_profile_folder location relatvie to main folder.
     post : dict
@@ -31,20 +31,29 @@ def get_pv_prod_factor(input_vals, solar_profile_folder, post, pv_watts_api_key)
         List of solar production factors.
 
     """
+    pv_prod_factor_csv_file_path = get_pv_prod_factor_path(input_vals, solar_profile_folder, post)
     if "solar_production_factor_file" in input_vals and not_none(input_vals["solar_production_factor_file"]):
-        return list(pd.read_csv(input_vals["solar_production_factor_file"], header=None).iloc[:,0]) 
+        return list(pd.read_csv(pv_prod_factor_csv_file_path, header=None).iloc[:,0]) 
     
     else:
-        if "latitude" in input_vals:
-            latitude = input_vals["latitude"]
-            longitude = input_vals["longitude"]
-        else:
-            latitude = post["Scenario"]["Site"]["latitude"]
-            longitude = post["Scenario"]["Site"]["longitude"]
-            
-        pv_prod_factor_csv_file_path = os.path.join(solar_profile_folder, f"PVproductionFactor_{latitude}_{longitude}.csv")
-        
         if not os.path.isfile(pv_prod_factor_csv_file_path):
+            latitude, longitude = get_latitude_longitude(input_vals, post)
             download_pv_watts(pv_prod_factor_csv_file_path, pv_watts_api_key, latitude, longitude)
             
         return list(pd.read_csv(pv_prod_factor_csv_file_path, header=None).iloc[:,0]) 
+
+
+def get_latitude_longitude(input_vals, post):
+    """Return site latitude and longitude from input values, or from `post` if not in input values"""
+    if "latitude" in input_vals:
+        return input_vals["latitude"], input_vals["longitude"]
+    else:
+        return post["Scenario"]["Site"]["latitude"], post["Scenario"]["Site"]["longitude"]
+
+
+def get_pv_prod_factor_path(input_vals, solar_profile_folder, post):
+    """Return path of csv that `get_pv_prod_factor` reads pv production factors from (which may not be downloaded yet)"""
+    if "solar_production_factor_file" in input_vals and not_none(input_vals["solar_production_factor_file"]):
+        return input_vals["solar_production_factor_file"]
+    latitude, longitude = get_latitude_longitude(input_vals, post)
+    return os.path.join(solar_profile_folder, f"PVproductionFactor_{latitude}_{longitude}.csv")
@@ -3,6 +3,7 @@
 import os
 import time
 import sys
+import json
 import shutil
 # import pandas as pd
 import datetime as dt
@@ -12,57 +13,250 @@ from pathlib import Path
 from ochre import Dwelling
 from ochre.FileIO import default_input_path
 from novametrics.support.utils import get_dictionary_value, get_filename
+from novametrics.inputs.ochre_support_functions import load_ochre_outputs, get_output_file_keys, missing_hourly_columns
+from novametrics.inputs.ochre_sidecar import compact_hourly_outputs, SIDECAR_FOLDER, HEADER_FILE
+from novametrics.support.worker_pool import run_pooled
+from novametrics.support.weather_store import get_weather_folder
 # from nova_metrics.apiquery.download_nsrdb import download_nsrdb
 #%%
-def run_ochre(ochre_controls):
+def run_ochre(ochre_controls, n_workers = None, incremental = True, retry_failed = False):
     """
     Runs OCHRE model for each building in `inputs_folder` and saves results to `results_folder`, both of which can be specified in `ochre_controls` dictionary. 
     
     Results saved in same subfolder structure as inputs.
+    After each building is simulated its outputs are loaded once to write the binary sidecar used for REopt post creation.
+    If `n_workers` (or the "n_workers" value of `ochre_controls` if `n_workers` is not given) is greater than 1, then
+    buildings are simulated that many at a time in long-lived worker processes (see `worker_pool.run_pooled`), so that
+    a crash in one building does not affect the others. OCHRE is imported, and the default inputs and weather folder
+    are resolved, once per worker by `init_ochre_worker` rather than once per building. OCHRE still reads its input
+    files for each building.
+    Workers are replaced after the "worker_max_jobs" buildings (defaults to 25) or once they use more than
+    "worker_max_memory_mb" (defaults to 4000) of `ochre_controls`. "worker_start_method" can set the multiprocessing
+    start method. Worker startup time is charged to each worker's first building and summarized at the end.
+    If `incremental` is True then buildings whose outputs are complete (see `outputs_complete`) and which did not fail
+    in the last run are skipped, so an interrupted run picks up where it stopped. The outcome of each building is saved to the run status file next to
+    the OCHRE outputs folder as soon as it finishes. If `retry_failed` is True then only the buildings which failed
+    in earlier runs are simulated.
+
+    Returns
+    -------
+    list
+        Dictionary of "building", "status" ("success" or "failed"), "error" and "seconds" for each building simulated,
+        along with the `worker_pool` telemetry if buildings were run in workers.
     """
     t1 = time.time()
+    if n_workers is None:
+        n_workers = int(get_dictionary_value(ochre_controls, "n_workers", 1))
+    # Extracts weather archives before any worker starts, so workers only look them up
+    init_ochre_worker(ochre_controls)
+    jobs = ochre_jobs(ochre_controls)
+    output_main_folder = get_dictionary_value(ochre_controls, "ochre_outputs_main_folder", "OCHRE")
+    run_status = load_run_status(output_main_folder)
+    n_buildings = len(jobs)
+    if retry_failed:
+        jobs = [job for job in jobs if run_status.get(job["building"], {}).get("status") == "failed"]
+        print(f"Retrying {len(jobs)} OCHRE buildings which failed in earlier runs")
+    elif incremental:
+        jobs = [job for job in jobs if run_status.get(job["building"], {}).get("status") == "failed" or not outputs_complete(job, ochre_controls)]
+        print(f"Skipping {n_buildings - len(jobs)} of {n_buildings} OCHRE buildings with complete outputs")
+    
+    def record_result(result):
+        run_status[result["job"]["building"]] = dict({k: result.get(k) for k in RUN_STATUS_KEYS}, finished=time.time())
+        save_run_status(output_main_folder, run_status)
+
+    if n_workers > 1:
+        print(f"Running {len(jobs)} OCHRE buildings with {n_workers} workers")
+        max_jobs = get_dictionary_value(ochre_controls, "worker_max_jobs", 25)
+        max_memory_mb = get_dictionary_value(ochre_controls, "worker_max_memory_mb", 4000)
+        results = run_pooled(jobs, run_ochre_building, (ochre_controls,), n_workers, max_jobs_per_worker=int(max_jobs), max_memory_mb=float(max_memory_mb),
+                             initializer=init_ochre_worker, initargs=(ochre_controls,), on_result=record_result,
+                             start_method=get_dictionary_value(ochre_controls, "worker_start_method", None))
+        print_worker_telemetry(results)
+    else:
+        results = []
+        for job in jobs:
+            results.append(run_ochre_building(job, ochre_controls))
+            record_result(results[-1])
+    for result in results:
+        result["building"] = result.pop("job")["building"]
+    
+    failed = [result for result in results if result["status"] != "success"]
+    print(f"Finished {len(results) - len(failed)} of {len(results)} OCHRE buildings")
+    for result in failed:
+        print(f"OCHRE run {result['building']} failed. Error {result['error']}.")
+    if len(failed) > 0:
+        print(f"Failed buildings are recorded in {run_status_file(output_main_folder)} and can be rerun on their own with --retry_failed_ochre")
+    print("Time to run OCHRE:", time.time() - t1)
+    return results
+
+
+def print_worker_telemetry(results):
+    """Print total and per-building worker startup time, memory and simulation time of `run_pooled` `results`"""
+    if len(results) == 0:
+        return
+    startup_seconds = [r.get("startup_seconds") or 0 for r in results]
+    n_workers_started = sum(1 for s in startup_seconds if s > 0)
+    simulate_seconds = sum(r["seconds"] for r in results)
+    peak_rss = max((r.get("worker_peak_rss_mb") or 0 for r in results), default=0)
+    print(f"OCHRE worker startup: {sum(startup_seconds):.1f} s over {n_workers_started} workers, {sum(startup_seconds)/len(results):.2f} s per building. "
+          f"Simulation: {simulate_seconds/len(results):.1f} s per building. Peak worker memory {peak_rss:.0f} MB")
+
+
+# Values of each building's result saved to the run status file
+RUN_STATUS_KEYS = ["status", "error", "seconds", "startup_seconds", "worker_pid", "worker_job_number", "worker_rss_mb", "worker_peak_rss_mb"]
+
+
+def run_status_file(output_main_folder):
+    """Return path of the run status file of OCHRE outputs folder `output_main_folder`, saved next to the folder so it is not mistaken for a building"""
+    return os.path.normpath(output_main_folder) + "_status.json"
+
+
+def load_run_status(output_main_folder):
+    """Return dictionary of building to its last run status, from the run status file of `output_main_folder`"""
+    try:
+        with open(run_status_file(output_main_folder), "r") as fp:
+            return json.load(fp)["buildings"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def save_run_status(output_main_folder, run_status):
+    path = run_status_file(output_main_folder)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fp:
+        json.dump({"buildings": run_status}, fp, indent=0, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def outputs_complete(job, ochre_controls):
+    """
+    Return True if the output folder of `job` has every file `load_ochre_outputs` reads, non-empty and newer than the job's input files
+
+    Input files are the building's properties (in.xml and in.yaml) and schedule (schedules.csv) files. Hourly outputs compacted
+    into the REopt sidecar by the "reopt" output profile count as present.
+    """
+    try:
+        output_files = os.listdir(job["output_path"])
+        input_files = [job["properties_file"], job["schedule_file"]] + ([job["properties_yaml_file"]] if job.get("properties_yaml_file") else [])
+        inputs_time = max(os.path.getmtime(f) for f in input_files)
+    except OSError:
+        return False
+    for name, file_end in get_output_file_keys(ochre_controls).items():
+        matches = [f for f in output_files if f.endswith(file_end)]
+        if len(matches) > 0:
+            file_path = os.path.join(job["output_path"], matches[0])
+        elif name == "hourly_inputs":
+            # The "reopt" output profile keeps hourly outputs in the sidecar only
+            file_path = os.path.join(job["output_path"], SIDECAR_FOLDER, HEADER_FILE)
+            if not os.path.isfile(file_path):
+                return False
+        else:
+            return False
+        stat = os.stat(file_path)
+        if stat.st_size == 0 or stat.st_mtime < inputs_time:
+            return False
+    return True
+
+
+# OCHRE inputs shared by every building, resolved once per process by `init_ochre_worker`
+_worker_inputs = {}
+
+
+def init_ochre_worker(ochre_controls):
+    """
+    Prepare this process to simulate buildings of `ochre_controls`, as the initializer of OCHRE worker processes
+
+    OCHRE is imported along with this module. Resolves the OCHRE default inputs folder and the weather folder once,
+    extracting weather archives into the shared weather store if needed, rather than once per building.
+    """
+    if "default_inputs" in ochre_controls:
+        _worker_inputs["default_inputs"] = ochre_controls["default_inputs"]
+    else:
+        _worker_inputs["default_inputs"] = default_input_path
+    # Weather archives are extracted into the shared weather store once, rather than opened for every building
+    _worker_inputs["weather_file"] = get_weather_folder(ochre_controls)
+
+
+def ochre_jobs(ochre_controls):
+    """Return list of dictionaries of the input files and output folder of each building to simulate, as `run_ochre_building` takes"""
     input_main_folder = get_dictionary_value(ochre_controls, "ochre_inputs_main_folder", "ResStock")
     output_main_folder = get_dictionary_value(ochre_controls, "ochre_outputs_main_folder", "OCHRE")
-    ochre_weather_file = get_dictionary_value(ochre_controls, "weather_file_path", "https://data.nrel.gov/system/files/156/BuildStock_TMY3_FIPS.zip")
     properties_ext = get_dictionary_value(ochre_controls, "properties_file", "in.xml")
     schedule_ext = get_dictionary_value(ochre_controls, "schedule_inputs", "schedules.csv")
-    if "default_inputs" in ochre_controls:
-        default_inputs = ochre_controls["default_inputs"]
-    else:
-        default_inputs = default_input_path 
     #    
     input_path_list = [Path(f[0]) for f in os.walk(input_main_folder) if len(f[2]) > 0] #Gets subdirectories which contain files
-    relative_path_list = [path.relative_to(input_main_folder) for path in input_path_list]  
-    output_path_list = [os.path.join(output_main_folder, p) for p in relative_path_list]
-    for i in range(len(input_path_list)):
-        input_path = input_path_list[i]
-        output_path = output_path_list[i]
-        Path(output_path).mkdir(parents=True, exist_ok=True)
+    jobs = []
+    for input_path in input_path_list:
+        relative_path = input_path.relative_to(input_main_folder)
         
         ##TODO setup optional download from nsrdb
         # download_nsrdb(ochre_weather_file, location_vals["latitude"], location_vals["longitude"], api_keys["nrel_api_key"])
         properties_filename = get_filename(input_path, [properties_ext, "in.xml", "in.yaml", ".xml", ".yaml"])
         properties_file = os.path.abspath(os.path.join(input_path, properties_filename))
-        properties_yaml_name = properties_file.rsplit(".", 1)[0] + ".yaml"
         
         schedule_file = os.path.abspath(os.path.join(input_path, get_filename(input_path, [schedule_ext, "schedules.csv", ".csv"])))
-        simulation_name = "OCHRE_Run"
+        # YAML properties read by `load_ochre_outputs`, if the building has them
+        yaml_filename = get_filename(input_path, properties_ext.rsplit(".", 1)[0] + ".yaml")
+        properties_yaml_file = None if yaml_filename is None else os.path.abspath(os.path.join(input_path, yaml_filename))
 
         # ochre_rate_file = os.path.join(location_inputs_folder, building, ' Rate.csv')
         # ochre_water_draw_file = os.path.join(location_inputs_folder, building, building + "_water_file.csv")
-        # print(f"properties_file: {properties_file}, schedule_file: {schedule_file}, weather file: {ochre_weather_file}, default_inputs: {default_inputs}, outputs: {output_path}")
-        print(f"Running OCHRE building {input_path}")
-        try:
-            run_ochre_single_case(simulation_name, properties_file, schedule_file, ochre_weather_file, default_inputs, output_path)
-            # shutil.copy(properties_yaml_name, output_path)
-            # shutil.copy(properties_file, output_path)
-        except Exception as e:
-            print(f"OCHRE run {input_path} failed. Error {sys.exc_info()[0]} {e}.")
-            # shutil.rmtree(output_path)
-    print("Time to run OCHRE:", time.time() - t1)
+        jobs.append({"building": str(relative_path), "input_path": str(input_path), "output_path": os.path.join(output_main_folder, relative_path),
+                     "properties_file": properties_file, "properties_yaml_file": properties_yaml_file, "schedule_file": schedule_file,
+                     "ochre_inputs_main_folder": input_main_folder, "ochre_outputs_main_folder": output_main_folder})
+    return jobs
+
+
+def run_ochre_building(job, ochre_controls):
+    """
+    Simulate the building of `job` (from `ochre_jobs`) and write its REopt sidecar
+
+    Uses the default inputs and weather folder resolved by `init_ochre_worker`, which is called first if this process has not run it.
+
+    Returns dictionary of "job", "status", "error" and "seconds". Errors are caught and returned rather than raised.
+    Errors writing the sidecar are only printed as a warning, except with the "reopt" output profile, which needs the sidecar.
+    """
+    t1 = time.time()
+    simulation_name = "OCHRE_Run"
+    Path(job["output_path"]).mkdir(parents=True, exist_ok=True)
+    # print(f"properties_file: {properties_file}, schedule_file: {schedule_file}, weather file: {ochre_weather_file}, default_inputs: {default_inputs}, outputs: {output_path}")
+    print(f"Running OCHRE building {job['input_path']}")
+    output_profile = get_dictionary_value(ochre_controls, "output_profile", "full")
+    verbosity = int(get_dictionary_value(ochre_controls, "ochre_verbosity", 9))
+    if len(_worker_inputs) == 0:
+        init_ochre_worker(ochre_controls)
+    try:
+        run_ochre_single_case(simulation_name, job["properties_file"], job["schedule_file"], _worker_inputs["weather_file"], _worker_inputs["default_inputs"],
+                              job["output_path"], verbosity)
+        # shutil.copy(properties_file, output_path)
+    except Exception as e:
+        return {"job": job, "status": "failed", "error": f"{sys.exc_info()[0]} {e}", "seconds": time.time() - t1}
+        # shutil.rmtree(output_path)
+
+    building_controls = dict(ochre_controls, ochre_inputs_main_folder=job["ochre_inputs_main_folder"], ochre_outputs_main_folder=job["ochre_outputs_main_folder"],
+                             ochre_outputs_subfolder=job["building"])
+    try:
+        if output_profile == "reopt":
+            # Keep only the columns REopt posts use, in the binary sidecar, and drop the wide hourly csv
+            missing = missing_hourly_columns(load_ochre_outputs(dict(building_controls, ochre_sidecar=True)))
+            if len(missing) > 0:
+                raise Exception(f"OCHRE hourly outputs lack columns REopt posts need, so they were not compacted (is ochre_verbosity too low?): {missing}")
+            hourly_inputs_key = get_output_file_keys(ochre_controls)["hourly_inputs"]
+            for f in os.listdir(job["output_path"]):
+                if f.endswith(hourly_inputs_key):
+                    compact_hourly_outputs(job["output_path"], f)
+        else:
+            load_ochre_outputs(building_controls)
+    except Exception as e:
+        if output_profile == "reopt":
+            # The "reopt" profile keeps outputs in the sidecar only, so the building is not usable without it
+            return {"job": job, "status": "failed", "error": f"{sys.exc_info()[0]} {e}", "seconds": time.time() - t1}
+        # The sidecar is optional. Post creation reads the OCHRE outputs directly instead
+        print(f"Warning: OCHRE building {job['input_path']} simulated, but writing its REopt sidecar failed. Error {sys.exc_info()[0]} {e}.")
+    return {"job": job, "status": "success", "error": "", "seconds": time.time() - t1}
         
 
-def run_ochre_single_case(simulation_name, properties_file, schedule_file, weather_path, default_input_path, output_folder):
+def run_ochre_single_case(simulation_name, properties_file, schedule_file, weather_path, default_input_path, output_folder, verbosity = 9):
     """
     Run single ochre simulation and save outputs to `output_folder`
 
@@ -75,11 +269,13 @@ def run_ochre_single_case(simulation_name, properties_file, schedule_file, weath
     schedule_file : str
         Path to OCHRE schedule file.
     weather_path : str
-        Path to zipped weather file.
+        Path to folder of weather files, such as the extracted TMY3 files of the weather store (see `weather_store.get_weather_folder`).
     default_input_path : str 
         Path to OCHRE default inputs. Generally taken from default OCHRE paths.
     output_folder : str
         Path to folder where outputs will be saved.
+    verbosity : int
+        OCHRE results verbosity (1-9). The RC node and equipment columns REopt posts use are only written at high verbosity.
     """
     
     dwelling_args = {
@@ -104,7 +300,7 @@ def run_ochre_single_case(simulation_name, properties_file, schedule_file, weath
     'save_results': True,
     'output_path': output_folder,
     # 'export_res': dt.timedelta(days=61),
-    'verbosity': 9,  # verbosity of results file (1-9)
+    'verbosity': verbosity,  # verbosity of results file (1-9)
 
     # 'ext_time_res': dt.timedelta(minutes=15),
     'save_matrices': True,
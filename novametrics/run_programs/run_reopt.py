@@ -1,89 +1,111 @@
 import urllib3
 urllib3.disable_warnings()
-import requests
-import json
-import time
+from novametrics.support import http_client
 import os 
 from pathlib import Path
 
-from novametrics.support.utils import load_post, save_post
+from novametrics.support.utils import load_post, dumps, loads
+from novametrics.support.result_store import save_results, results_exist
+from novametrics.support.poll_engine import PollEngine, poll_until_complete
+from novametrics.support.result_cache import post_hash
+from novametrics.support.job_journal import JobJournal, SUBMITTED, COMPLETE, FAILED
+from novametrics.support.post_scheduler import schedule_jobs
 #%%
-def reo_optimize(post, API_KEY, root_url='https://developer.nrel.gov/api/reopt', poll_interval=10):
+def get_results_url(run_uuid, API_KEY, root_url='https://developer.nrel.gov/api/reopt'):
+    """Return REopt API results url for `run_uuid`"""
+    return root_url + '/v1/job/' + run_uuid + '/results/?api_key=' + API_KEY
+
+
+def reo_submit(post, API_KEY, root_url='https://developer.nrel.gov/api/reopt'):
     """
-    Function for polling the REopt API results URL until status is not "Optimizing..."
+    Submit `post` to the REopt API /job endpoint and return the run_uuid of the new job
     :post: the API reo /job endpoint POST which define the Scenario with user inputs
     :param API_KEY: API key for accessing API on NREL's production server
     :param root_url: location of the API to poll; use 'http://localhost:8000' for localhost, not 0.0.0.0.8000
-    :param poll_interval: seconds
-    :return: dictionary response (once status is not "Optimizing...")
+    :return: run_uuid, or None if the submission failed
     """
     
     post_url = root_url + '/v1/job/?api_key=' + API_KEY
-    results_url = root_url + '/v1/job/<run_uuid>/results/?api_key=' + API_KEY
     
-    resp = requests.post(url=post_url, json=post)
+    resp = http_client.post(url=post_url, data=dumps(post), headers={"Content-Type": "application/json"})
 
     if not resp.ok:
         # print("Status code {}. {}".format(resp.status_code, resp.content))
         print("Status code {}.".format(resp.status_code))
+        return None
     else:
         print("Response OK from {}.".format(post_url))
-        run_id_dict = json.loads(resp.text)
+        run_id_dict = loads(resp.content)
 
         try:
             run_id = run_id_dict['run_uuid']
         except KeyError:
-            msg = "Response from {} did not contain run_uuid.".format(post_url)
+            print("Response from {} did not contain run_uuid.".format(post_url))
+            return None
+
+        return run_id
 
-        return poller(url=results_url.replace('<run_uuid>', run_id), poll_interval=poll_interval)
+
+def reo_optimize(post, API_KEY, root_url='https://developer.nrel.gov/api/reopt', poll_interval=10, poll_policy=None, cache=None):
+    """
+    Function for polling the REopt API results URL until status is not "Optimizing..."
+    :post: the API reo /job endpoint POST which define the Scenario with user inputs
+    :param API_KEY: API key for accessing API on NREL's production server
+    :param root_url: location of the API to poll; use 'http://localhost:8000' for localhost, not 0.0.0.0.8000
+    :param poll_interval: seconds
+    :param poll_policy: optional PollPolicy setting backoff and max wall time. Defaults to backoff from `poll_interval`
+    :param cache: optional ResultCache. If `post` has been solved before then returns cached results without submitting
+    :return: dictionary response (once status is not "Optimizing...")
+    """
+    if cache is not None:
+        key = post_hash(post, root_url)
+        reopt_results = cache.get(key)
+        if reopt_results is not None:
+            print(f"Using cached results {key}")
+            return reopt_results
+        
+    run_uuid = reo_submit(post, API_KEY, root_url=root_url)
+    if run_uuid is not None:
+        reopt_results = poller(url=get_results_url(run_uuid, API_KEY, root_url), poll_interval=poll_interval, post=post, poll_policy=poll_policy)
+        if cache is not None:
+            cache.put(key, reopt_results)
+        return reopt_results
 
 #%%
 
-def poller(url, poll_interval):
+def poller(url, poll_interval, post=None, poll_policy=None):
     """
     Function for polling the REopt API results URL until status is not "Optimizing..."
     :param url: results url to poll
     :param poll_interval: seconds
+    :param post: optional submitted post, used to estimate when to first poll
+    :param poll_policy: optional PollPolicy setting backoff and max wall time
     :return: dictionary response (once status is not "Optimizing...")
     """
-    key_error_count = 0
-    key_error_threshold = 4
-    status = "Optimizing..."
-    print("Polling {} for results with interval of {}s...".format(url, poll_interval))
-    while True:
+    return poll_until_complete(url, poll_interval, post=post, policy=poll_policy)
+#%%
 
-        resp = requests.get(url=url, verify=False)
-        resp_dict = json.loads(resp.text)
 
-        try:
-            status = resp_dict['outputs']['Scenario']['status']
-        except KeyError:
-            key_error_count += 1
-            print('KeyError count: {}'.format(key_error_count))
-            if key_error_count > key_error_threshold:
-                print('Breaking polling loop due to KeyError count threshold of {} exceeded.'.format(key_error_threshold))
-                break
-
-        if status != "Optimizing...":
-            time.sleep(poll_interval)
-            resp = requests.get(url=url, verify=False)
-            resp_dict = json.loads(resp.text)
-            break
-        else:
-            # Add extra sleep time for slower-responding localhost calls
-            # even while results are expected to be in response after status != "Optimizing..."
-            time.sleep(poll_interval)
-
-    return resp_dict
-#%%
+def reopt_status(reopt_results):
+    """Return status of REopt response `reopt_results`, or None if it has none"""
+    try:
+        return reopt_results['outputs']['Scenario']['status']
+    except (KeyError, TypeError):
+        return None
 
 
-def run_reopt(post_folder, results_folder, api_key, start_folder = 1, root_url = 'https://developer.nrel.gov/api/reopt', overwrite = True, poll_interval = 10):
+def run_reopt(post_folder, results_folder, api_key, start_folder = 1, root_url = 'https://developer.nrel.gov/api/reopt', overwrite = True, poll_interval = 10,
+              reopt_workers = 1, poll_policy = None, cache = None, journal_file = None, priorities = {},
+              compress_results = True):
     """
     Runs REopt posts in `post_folder` and saves results to `results_folder`
     
     Results saved in same subfolder structure as inputs.
-    Change `root_url` to 'http://localhost:8000' for localhost
+    Change `root_url` to 'http://localhost:8000' for localhost.
+    Up to `reopt_workers` posts are kept in flight at once, and each result is saved as soon as its job finishes.
+    Posts are run highest priority first, then shortest estimated solve time first.
+    Every submitted run_uuid is recorded in a journal. If a previous run was interrupted or timed out then posts
+    which are still solving on the server are polled again first instead of being resubmitted, even if `overwrite` is False.
 
     Parameters
     ----------
@@ -96,13 +118,30 @@ def run_reopt(post_folder, results_folder, api_key, start_folder = 1, root_url =
     root_url: str 
         Location of the API to poll; use 'http://localhost:8000' for localhost.
     poll_interval: int
-        Seconds between poll query
+        Seconds between the first poll queries of a job. Later polls back off exponentially.
+    reopt_workers: int
+        Number of REopt jobs to run concurrently. Defaults to 1 (run posts one after another).
+    poll_policy: PollPolicy, optional
+        Polling schedule with backoff, jitter and max wall time. Defaults to `PollPolicy(initial_interval=poll_interval)`.
+    cache: ResultCache, optional
+        Cache of results keyed by post hash. Posts already in the cache are not resubmitted, even if `overwrite` is True.
+    journal_file: str, optional
+        Path to jsonl journal of submitted jobs. Defaults to `results_folder` + "_journal.jsonl".
+    priorities: dict, optional
+        Dictionary of post path or name glob patterns to priorities, e.g. {"*baseline*": 10}. Unmatched posts have priority 0.
+    compress_results: bool
+        If True (default) results are saved as compact gzipped json ("<post_name>.json.gz"), otherwise as plain json.
     """
     subfolders = next(os.walk(post_folder))[1]
     if len(subfolders) == 0:
         folder_list = [post_folder]
     else:
         folder_list = [os.path.join(post_folder, x) for x in subfolders]
+        
+    if journal_file is None:
+        journal_file = os.path.normpath(results_folder) + "_journal.jsonl"
+        
+    jobs = []
     for building_folder in folder_list[(start_folder-1):len(folder_list)]:
         print("_"*60)
         print(f"Running Reopt for {building_folder}")
@@ -114,12 +153,102 @@ def run_reopt(post_folder, results_folder, api_key, start_folder = 1, root_url =
             
             post_dir = os.path.join(post_folder, directory)
             results_dir = os.path.join(results_folder, directory)
-            results_file = os.path.join(results_folder, directory, post_name)
-            
             Path(results_dir).mkdir(parents=True, exist_ok=True)
     
-            if (not os.path.isfile(results_file)) or overwrite:
+            if (not results_exist(results_dir, post_name)) or overwrite:
+                jobs.append((post_dir, results_dir, post_name))
+    
+    journal = JobJournal(journal_file)
+    queued = {os.path.normpath(os.path.join(post_dir, post_name)): (post_dir, results_dir, post_name) for post_dir, results_dir, post_name in jobs}
+    resumed = []
+    for entry in journal.outstanding():
+        post_path = os.path.normpath(entry["post_path"])
+        if post_path in queued:
+            resumed.append(queued.pop(post_path))
+            continue
+        directory = os.path.relpath(os.path.dirname(post_path), post_folder)
+        if directory.split(os.sep)[0] != os.pardir and os.path.isfile(post_path):
+            results_dir = os.path.normpath(os.path.join(results_folder, directory))
+            Path(results_dir).mkdir(parents=True, exist_ok=True)
+            post_dir, post_name = os.path.split(entry["post_path"])
+            resumed.append((post_dir, results_dir, post_name))
+    if len(resumed) > 0:
+        print(f"Resuming {len(resumed)} REopt posts still solving from journal {journal_file}")
+        
+    if len(resumed) + len(queued) > 0:
+        jobs = resumed + schedule_jobs(list(queued.values()), reopt_workers, priorities, journal.solve_times())
+        run_reopt_jobs(jobs, api_key, root_url=root_url, poll_interval=poll_interval, reopt_workers=reopt_workers, poll_policy=poll_policy, 
+                       cache=cache, journal=journal, compress_results=compress_results)
+
+
+def run_reopt_jobs(jobs, api_key, root_url = 'https://developer.nrel.gov/api/reopt', poll_interval = 10, reopt_workers = 1, poll_policy = None, cache = None,
+                   journal = None, compress_results = True):
+    """
+    Runs `jobs`, a list of (post_dir, results_dir, post_name) tuples, keeping up to `reopt_workers` jobs in flight
+
+    All in-flight jobs are polled from a single `PollEngine` loop, and each result is saved as soon as its job finishes.
+    Identical posts are solved once: later copies wait for the in-flight job (or are read from `cache`) instead of being submitted.
+    If `journal` is given then each job is recorded in it, and jobs it shows as still solving are polled rather than resubmitted.
+    Jobs are journaled complete only if their status is "optimal" and failed otherwise. Jobs given up on after the
+    max wall time of `poll_policy` stay submitted, so a later run resumes polling them.
+    """
+    print(f"Running {len(jobs)} REopt posts with {reopt_workers} workers")
+    engine = PollEngine(poll_interval, policy=poll_policy)
+    engine.start()
+    pending = list(reversed(jobs))
+    waiting = {}  # post hash -> jobs waiting on the in-flight solve of that post
+    run_uuids = {}  # post hash -> run_uuid of the in-flight solve
+    try:
+        while len(pending) > 0 or len(waiting) > 0:
+            while len(pending) > 0 and len(waiting) < reopt_workers:
+                post_dir, results_dir, post_name = pending.pop()
+                post_path = os.path.join(post_dir, post_name)
                 print("Running REopt for", post_dir, "-", post_name)
-                post = load_post(post_dir, post_name)
-                reopt_results = reo_optimize(post, api_key, root_url=root_url, poll_interval=poll_interval)
-                save_post(reopt_results, results_dir, post_name)
+                try:
+                    post = load_post(post_dir, post_name)
+                    key = post_hash(post, root_url)
+                    if key in waiting:
+                        waiting[key].append((post_dir, results_dir, post_name))
+                        if journal is not None:
+                            journal.record(post_path, key, run_uuids[key], SUBMITTED)
+                        continue
+                    reopt_results = None if cache is None else cache.get(key)
+                    if reopt_results is not None:
+                        print(f"Using cached results {key}")
+                        save_results(reopt_results, results_dir, post_name, compress_results)
+                        continue
+                    run_uuid = None if journal is None else journal.outstanding_run_uuid(post_path, key)
+                    if run_uuid is not None:
+                        print(f"Resuming run_uuid {run_uuid} from journal")
+                    else:
+                        run_uuid = reo_submit(post, api_key, root_url=root_url)
+                except Exception as e:
+                    print(f"REopt run {post_dir} - {post_name} failed due to {e}")
+                    continue
+                if run_uuid is not None:
+                    if journal is not None:
+                        journal.record(post_path, key, run_uuid, SUBMITTED)
+                    engine.add(get_results_url(run_uuid, api_key, root_url), tag=key, post=post)
+                    waiting[key] = [(post_dir, results_dir, post_name)]
+                    run_uuids[key] = run_uuid
+                    
+            if len(waiting) > 0:
+                key, reopt_results, error = engine.completed.get()
+                status = None if error is not None else reopt_status(reopt_results)
+                if status == "optimal" and cache is not None:
+                    cache.put(key, reopt_results)
+                run_uuid = run_uuids.pop(key)
+                for post_dir, results_dir, post_name in waiting.pop(key):
+                    if isinstance(error, TimeoutError):
+                        print(f"REopt run {post_dir} - {post_name} is still solving as run_uuid {run_uuid}. It will be resumed by the next run.")
+                        continue
+                    if error is not None:
+                        print(f"REopt run {post_dir} - {post_name} failed due to {error}")
+                    else:
+                        if status != "optimal":
+                            print(f"REopt run {post_dir} - {post_name} finished with status {status}")
+                        save_results(reopt_results, results_dir, post_name, compress_results)
+                    if journal is not None:
+                        journal.record(os.path.join(post_dir, post_name), key, run_uuid, COMPLETE if status == "optimal" else FAILED)
+    finally:
+        engine.stop()
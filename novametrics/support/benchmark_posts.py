@@ -0,0 +1,91 @@
+"""
+Micro-benchmark of the OCHRE post builders `hvac_post` and `wh_post`
+
+Builds synthetic OCHRE outputs in memory (no OCHRE run or files needed) and reports the
+mean time per building to:
+-flatten the RC matrices and u_inputs with the former DataFrame stack approach and with `flatten_columns`
+-subtract a load with the former list comprehension and with `subtract_load`
+-run `hvac_post` and `wh_post` on a post
+
+Run from the command line with, for example,
+    python -m novametrics.support.benchmark_posts --n_buildings 20 --n_input_nodes 10
+"""
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from novametrics.inputs.ochre_support_functions import hvac_post, wh_post, flatten_columns, subtract_load, HOURLY_INPUT_COLUMNS
+
+HOURS = 8760
+
+
+def synthetic_ochre_outputs(n_temp_nodes = 8, n_input_nodes = 10, n_wh_nodes = 12, seed = 0):
+    """Return [parsed_prop, a_matrix, b_matrix, hourly_inputs, a_matrix_wh, b_matrix_wh] shaped like `load_ochre_outputs` outputs"""
+    rng = np.random.default_rng(seed)
+    temp_nodes = ["T_LIV"] + [f"T_{i}" for i in range(1, n_temp_nodes)]
+    input_nodes = ["H_LIV"] + [f"H_{i}" for i in range(1, n_input_nodes)]
+    wh_nodes = [f"T_WH{i}" for i in range(1, n_wh_nodes + 1)]
+    wh_input_nodes = [f"H_WH{i}" for i in range(1, n_wh_nodes + 1)]
+    a_matrix = pd.DataFrame(rng.normal(size=(n_temp_nodes, n_temp_nodes)), index=temp_nodes, columns=temp_nodes)
+    b_matrix = pd.DataFrame(rng.normal(size=(n_temp_nodes, n_input_nodes)), index=temp_nodes, columns=input_nodes)
+    a_matrix_wh = pd.DataFrame(rng.normal(size=(n_wh_nodes, n_wh_nodes)), index=wh_nodes, columns=wh_nodes)
+    b_matrix_wh = pd.DataFrame(rng.normal(size=(n_wh_nodes, n_wh_nodes)), index=wh_nodes, columns=wh_input_nodes)
+    columns = HOURLY_INPUT_COLUMNS + temp_nodes + input_nodes + wh_nodes + wh_input_nodes
+    hourly_inputs = pd.DataFrame(rng.uniform(0.1, 3, size=(HOURS, len(columns))), columns=columns)
+    parsed_prop = {"heating fuel": "Electricity", "cooling fuel": "Electricity", "water heater fuel": "Electricity",
+                   "hp_size_kw": 2.4, "hp_size_heat": 8, "hp_dse": 1, "hp_fan_power_ratio": 0.02,
+                   "ac_size_kw": 1.75, "ac_size_heat": 7, "ac_dse": 1, "ac_fan_power_ratio": 0.02,
+                   "erwh_size_kw": 4.5, "hpwh_size_kw": 0.0}
+    return [parsed_prop, a_matrix, b_matrix, hourly_inputs, a_matrix_wh, b_matrix_wh]
+
+
+def stack_flatten(df):
+    """Former flattening of RC matrices, kept as the benchmark baseline"""
+    return list(df.T.stack().reset_index(name='new')['new'])
+
+
+def time_per_building(func, n_buildings):
+    t1 = time.perf_counter()
+    for i in range(n_buildings):
+        func()
+    return (time.perf_counter() - t1) / n_buildings
+
+
+def benchmark_posts(n_buildings = 20, n_temp_nodes = 8, n_input_nodes = 10, n_wh_nodes = 12):
+    """Return dictionary of mean seconds per building for each step"""
+    ochre_outputs = synthetic_ochre_outputs(n_temp_nodes, n_input_nodes, n_wh_nodes)
+    hourly_inputs, b_matrix = ochre_outputs[3], ochre_outputs[2]
+    u_inputs = hourly_inputs.loc[:, b_matrix.keys()]
+    loads = [1.0]*HOURS
+    load = hourly_inputs.loc[:, 'HVAC Heating Electric Power (kW)']
+
+    def build_post():
+        post = {"Scenario": {"Site": {"LoadProfile": {"loads_kw": list(loads)}}}}
+        wh_post(post, ochre_outputs, {})
+        hvac_post(post, ochre_outputs, {})
+
+    return {"flatten_stack_s": time_per_building(lambda: stack_flatten(u_inputs), n_buildings),
+            "flatten_columns_s": time_per_building(lambda: flatten_columns(u_inputs), n_buildings),
+            "subtract_list_s": time_per_building(lambda: [loads[i] - load[i] for i in range(len(load))], n_buildings),
+            "subtract_load_s": time_per_building(lambda: subtract_load(loads, load.to_numpy()), n_buildings),
+            "hvac_wh_post_s": time_per_building(build_post, n_buildings)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCHRE post builders on synthetic OCHRE outputs.")
+    parser.add_argument("--n_buildings", type=int, default=20, help="Number of times to repeat each step.")
+    parser.add_argument("--n_temp_nodes", type=int, default=8, help="Number of envelope RC temperature nodes.")
+    parser.add_argument("--n_input_nodes", type=int, default=10, help="Number of envelope RC input nodes.")
+    parser.add_argument("--n_wh_nodes", type=int, default=12, help="Number of water tank nodes.")
+    args = parser.parse_args()
+
+    b = benchmark_posts(args.n_buildings, args.n_temp_nodes, args.n_input_nodes, args.n_wh_nodes)
+    print(f"Flatten u_inputs:  stack {1000*b['flatten_stack_s']:.1f} ms, flatten_columns {1000*b['flatten_columns_s']:.1f} ms "
+          f"({b['flatten_stack_s']/b['flatten_columns_s']:.0f}x)")
+    print(f"Subtract load:     list {1000*b['subtract_list_s']:.1f} ms, subtract_load {1000*b['subtract_load_s']:.1f} ms "
+          f"({b['subtract_list_s']/b['subtract_load_s']:.0f}x)")
+    print(f"hvac_post + wh_post per building: {1000*b['hvac_wh_post_s']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Compression and accuracy check of rounding RC and HotWaterTank arrays in posts
+
+The RC and HotWaterTank `a_matrix`, `b_matrix` and `u_inputs` arrays make up most of an OCHRE
+post. They can be written with fewer significant digits by setting the `*_digits` options of
+the OCHRE sheet (see `ARRAY_DIGITS_SETTINGS`). For existing full precision posts (or synthetic
+ones) `benchmark_quantization` reports, for given digit settings:
+-bytes of each array at full precision and rounded, and the largest relative change of its values
+-bytes of the whole post, as json and gzip compressed
+-the largest change in RC and HotWaterTank temperatures and in lifecycle cost when the full precision
+and rounded posts are solved by the local REopt stand-in
+
+Run from the command line with, for example,
+    python -m novametrics.support.benchmark_quantization --post_folder reopt_posts --digits rc_u_inputs_digits=4 wh_u_inputs_digits=4
+"""
+import os
+import gzip
+import argparse
+import numpy as np
+from novametrics.support.utils import dumps, loads, load_post
+from novametrics.support.reopt_stand_in import solve, RC_SECTIONS
+from novametrics.support.benchmark_posts import synthetic_ochre_outputs
+from novametrics.inputs.ochre_support_functions import hvac_post, wh_post, quantize_post, ARRAY_DIGITS_SETTINGS
+
+DEFAULT_DIGITS = {"rc_a_matrix_digits": 6, "rc_b_matrix_digits": 6, "rc_u_inputs_digits": 4,
+                  "wh_a_matrix_digits": 6, "wh_b_matrix_digits": 6, "wh_u_inputs_digits": 4}
+
+
+def synthetic_post():
+    """Return full precision post with RC and HotWaterTank sections built from `synthetic_ochre_outputs`"""
+    ochre_outputs = synthetic_ochre_outputs()
+    post = {"Scenario": {"Site": {"LoadProfile": {"loads_kw": ochre_outputs[3].loc[:, 'Total Electric Power (kW)'].tolist()}}}}
+    wh_post(post, ochre_outputs, {})
+    hvac_post(post, ochre_outputs, {})
+    return post
+
+
+def list_posts(post_folder, n_posts):
+    """Return paths of up to `n_posts` posts with RC or HotWaterTank sections in `post_folder` and its subfolders"""
+    paths = []
+    for root, dirs, files in os.walk(post_folder):
+        for f in sorted(files):
+            if f.endswith(".json") and len(paths) < n_posts:
+                with open(os.path.join(root, f), "rb") as fp:
+                    data = fp.read()
+                if b'"RC"' in data or b'"HotWaterTank"' in data:
+                    paths.append(os.path.join(root, f))
+    return paths
+
+
+def compare_posts(post, digits):
+    """
+    Return dictionary of compression and accuracy statistics of rounding `post` arrays to `digits`
+
+    `digits` is a dictionary of `ARRAY_DIGITS_SETTINGS` names to significant digits.
+    """
+    quantized = quantize_post(loads(dumps(post)), digits)
+    stats = {"fields": {}}
+    for name, (section, field) in ARRAY_DIGITS_SETTINGS.items():
+        if field not in post["Scenario"]["Site"].get(section, {}):
+            continue
+        full_values = np.asarray(post["Scenario"]["Site"][section][field], dtype=float)
+        rounded_values = np.asarray(quantized["Scenario"]["Site"][section][field], dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative = np.abs(rounded_values - full_values) / np.abs(full_values)
+        stats["fields"][f"{section}.{field}"] = {"digits": digits.get(name), "full_bytes": len(dumps(full_values.tolist())),
+                                                  "rounded_bytes": len(dumps(rounded_values.tolist())),
+                                                  "max_relative_change": float(np.nanmax(relative[np.isfinite(relative)], initial=0))}
+    full_data, rounded_data = dumps(post), dumps(quantized)
+    stats.update({"full_bytes": len(full_data), "rounded_bytes": len(rounded_data),
+                  "full_gzip_bytes": len(gzip.compress(full_data)), "rounded_gzip_bytes": len(gzip.compress(rounded_data))})
+
+    full_results = solve(post, "full")["outputs"]["Scenario"]["Site"]
+    rounded_results = solve(quantized, "rounded")["outputs"]["Scenario"]["Site"]
+    for section in RC_SECTIONS:
+        if section in full_results:
+            stats[f"{section}_max_temperature_change_degC"] = float(np.max(np.abs(np.subtract(full_results[section]["temperatures_degC"],
+                                                                                              rounded_results[section]["temperatures_degC"]))))
+    full_lcc, rounded_lcc = full_results["Financial"]["lcc_us_dollars"], rounded_results["Financial"]["lcc_us_dollars"]
+    stats["lcc_relative_change"] = abs(rounded_lcc - full_lcc) / abs(full_lcc) if full_lcc != 0 else 0.0
+    return stats
+
+
+def benchmark_quantization(post_folder = None, digits = DEFAULT_DIGITS, n_posts = 5):
+    """Return list of (post name, `compare_posts` statistics) for posts in `post_folder`, or for a synthetic post if `post_folder` is None"""
+    if post_folder is None:
+        return [("synthetic", compare_posts(synthetic_post(), digits))]
+    return [(os.path.relpath(path, post_folder), compare_posts(load_post(*os.path.split(path)), digits)) for path in list_posts(post_folder, n_posts)]
+
+
+def parse_digits(digits_args):
+    """Return digits dictionary from list of "setting=digits" strings, e.g. ["rc_u_inputs_digits=4"]"""
+    digits = {}
+    for arg in digits_args:
+        name, n = arg.rsplit("=", 1)
+        if name not in ARRAY_DIGITS_SETTINGS:
+            raise ValueError(f"Unknown digits setting {name}. Options are {', '.join(ARRAY_DIGITS_SETTINGS)}")
+        digits[name] = int(n)
+    return digits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report post size and solved result changes from rounding RC and HotWaterTank arrays.")
+    parser.add_argument("--post_folder", default=None, help="Folder of full precision posts to check. Defaults to a synthetic post.")
+    parser.add_argument("--digits", nargs="+", default=None, help="Significant digits as setting=digits, e.g. rc_u_inputs_digits=4. Defaults to "
+                        + " ".join(f"{k}={v}" for k, v in DEFAULT_DIGITS.items()))
+    parser.add_argument("--n_posts", type=int, default=5, help="Number of posts from post_folder to check.")
+    args = parser.parse_args()
+
+    digits = DEFAULT_DIGITS if args.digits is None else parse_digits(args.digits)
+    for name, stats in benchmark_quantization(args.post_folder, digits, args.n_posts):
+        print(f"{name}: post {stats['full_bytes']/1e6:.2f} MB -> {stats['rounded_bytes']/1e6:.2f} MB "
+              f"({stats['full_gzip_bytes']/1e6:.2f} MB -> {stats['rounded_gzip_bytes']/1e6:.2f} MB gzipped)")
+        for field, field_stats in stats["fields"].items():
+            print(f"    {field:24s} digits {str(field_stats['digits']):>4s}: {field_stats['full_bytes']/1e3:.1f} kB -> "
+                  f"{field_stats['rounded_bytes']/1e3:.1f} kB, max relative change {field_stats['max_relative_change']:.1e}")
+        for section in RC_SECTIONS:
+            if f"{section}_max_temperature_change_degC" in stats:
+                print(f"    {section} max stand-in temperature change {stats[f'{section}_max_temperature_change_degC']:.2e} degC")
+        print(f"    lifecycle cost relative change {stats['lcc_relative_change']:.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Throughput benchmark for the REopt runner against the local REopt stand-in
+
+For each concurrency level, `benchmark_reopt` writes synthetic posts to a temporary folder,
+runs `run_reopt` against a `ReoptStandIn` server (in its own process, so that it does not
+share the runner's GIL) and reports:
+-jobs per minute
+-mean and max seconds from a job finishing on the server to its results being written
+-peak Python memory of the runner (from tracemalloc)
+-number of submit and poll requests the server received
+
+Run from the command line with, for example,
+    python -m novametrics.support.benchmark_reopt --n_jobs 200 --workers 1 8 32 --solve_seconds 5
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from novametrics.run_programs.run_reopt import run_reopt
+from novametrics.support import http_client
+from novametrics.support.poll_engine import PollPolicy
+from novametrics.support.reopt_stand_in import HOURS
+from novametrics.support.result_store import list_results, load_results
+
+
+def write_posts(post_folder, n_jobs, n_buildings = 10, rc_input_nodes = 0):
+    """Write `n_jobs` synthetic posts split across `n_buildings` building subfolders"""
+    for i in range(n_jobs):
+        building_folder = os.path.join(post_folder, f"bldg{i % n_buildings:07d}")
+        os.makedirs(building_folder, exist_ok=True)
+        site = {"latitude": 39.7, "longitude": -105.2,
+                "LoadProfile": {"loads_kw": [round(random.uniform(0.5, 3), 3) for h in range(HOURS)]},
+                "PV": {"prod_factor_series_kw": [round(max(0, random.uniform(-0.5, 1)), 4) for h in range(HOURS)]}}
+        if rc_input_nodes > 0:
+            site["RC"] = {"u_inputs": [random.uniform(-500, 500) for h in range(HOURS * rc_input_nodes)]}
+        with open(os.path.join(building_folder, f"post_{i}.json"), "w") as fp:
+            json.dump({"Scenario": {"Site": site}}, fp)
+
+
+def completion_to_write_latencies(results_folder):
+    """Return list of seconds between each job finishing on the stand-in and its results file being written"""
+    latencies = []
+    for path in list_results(results_folder):
+        results = load_results(*os.path.split(path))
+        try:
+            solved_time = results["outputs"]["Scenario"]["stand_in_solved_time"]
+        except (KeyError, TypeError):
+            continue
+        latencies.append(os.path.getmtime(path) - solved_time)
+    return latencies
+
+
+def start_stand_in(solve_seconds, solve_jitter, failure_rate, extra_series):
+    """Start `reopt_stand_in` in a subprocess. Returns the process and its root url once it is serving."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, "-m", "novametrics.support.reopt_stand_in", "--port", str(port),
+                                "--solve_seconds", str(solve_seconds), "--solve_jitter", str(solve_jitter),
+                                "--failure_rate", str(failure_rate), "--extra_series", str(extra_series)],
+                               stdout=subprocess.DEVNULL)
+    root_url = f"http://127.0.0.1:{port}"
+    for i in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, root_url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("REopt stand-in did not start")
+
+
+def benchmark_reopt(n_jobs = 100, workers = (1, 4, 16), solve_seconds = 5, solve_jitter = 0.5, failure_rate = 0, extra_series = 0,
+                    rc_input_nodes = 0, poll_interval = 1, work_folder = None):
+    """
+    Run the REopt runner against the local stand-in at each concurrency level in `workers`
+
+    Returns
+    -------
+    list
+        List of dictionaries of benchmark results, one per concurrency level.
+    """
+    if work_folder is None:
+        work_folder = tempfile.mkdtemp(prefix="reopt_benchmark_")
+    post_folder = os.path.join(work_folder, "posts")
+    write_posts(post_folder, n_jobs, rc_input_nodes=rc_input_nodes)
+
+    stand_in, root_url = start_stand_in(solve_seconds, solve_jitter, failure_rate, extra_series)
+    policy = PollPolicy(initial_interval=poll_interval, max_interval=max(poll_interval, solve_seconds), first_poll_base=poll_interval)
+    benchmarks = []
+    try:
+        for n_workers in workers:
+            results_folder = os.path.join(work_folder, f"results_{n_workers}")
+            stats = http_client.get(root_url + "/v1/stats/").json()
+            tracemalloc.start()
+            t1 = time.time()
+            run_reopt(post_folder, results_folder, "stand_in", root_url=root_url, reopt_workers=n_workers, poll_policy=policy)
+            elapsed = time.time() - t1
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            latencies = completion_to_write_latencies(results_folder)
+            new_stats = http_client.get(root_url + "/v1/stats/").json()
+            benchmarks.append({"workers": n_workers, "jobs": n_jobs, "seconds": elapsed, "jobs_per_minute": 60 * n_jobs / elapsed,
+                               "mean_completion_to_write_s": sum(latencies) / max(len(latencies), 1),
+                               "max_completion_to_write_s": max(latencies, default=0),
+                               "peak_memory_mb": peak_memory / 1e6,
+                               "submits": new_stats["submits"] - stats["submits"], "polls": new_stats["polls"] - stats["polls"]})
+    finally:
+        stand_in.terminate()
+        stand_in.wait()
+        shutil.rmtree(work_folder, ignore_errors=True)
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the REopt runner against a local REopt API stand-in.")
+    parser.add_argument("--n_jobs", type=int, default=100, help="Number of posts to run at each concurrency level.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16], help="Concurrency levels (reopt_workers) to benchmark.")
+    parser.add_argument("--solve_seconds", type=float, default=5, help="Mean stand-in solve latency in seconds.")
+    parser.add_argument("--solve_jitter", type=float, default=0.5, help="Fraction solve latency varies by between jobs.")
+    parser.add_argument("--failure_rate", type=float, default=0, help="Fraction of jobs which fail to solve.")
+    parser.add_argument("--extra_series", type=int, default=0, help="Extra 8760 series added to each result to grow the payload.")
+    parser.add_argument("--rc_input_nodes", type=int, default=0, help="Number of RC input nodes in each post (0 for PV only posts).")
+    parser.add_argument("--poll_interval", type=float, default=1, help="Initial poll interval in seconds.")
+    args = parser.parse_args()
+
+    benchmarks = benchmark_reopt(args.n_jobs, args.workers, args.solve_seconds, args.solve_jitter, args.failure_rate, args.extra_series,
+                                 args.rc_input_nodes, args.poll_interval)
+    print("_"*60)
+    for b in benchmarks:
+        print(f"workers {b['workers']:>4}: {b['jobs_per_minute']:8.1f} jobs/min, completion to write mean {b['mean_completion_to_write_s']:.2f}s "
+              f"max {b['max_completion_to_write_s']:.2f}s, peak memory {b['peak_memory_mb']:.1f} MB, {b['submits']} submits, {b['polls']} polls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Shared HTTP client for NREL and other API calls
+
+All API calls go through a single pooled `requests.Session` so that connections are kept
+alive and reused across submits, polls and downloads instead of paying a new TCP+TLS
+handshake on every call. Responses are requested gzip compressed.
+
+Each request first waits for a token from the `rate_limiter` bucket of its host, and
+the rate limit headers of each response update that bucket.
+
+Requests time out after `TIMEOUT` (connect, read) seconds unless a `timeout` is passed, so a
+stalled connection cannot hang the caller (such as the single `PollEngine` loop).
+
+Failed requests are retried with backoff based on the response class:
+-429 (rate limited) is always retried, waiting for the Retry-After header if given
+-5xx and connection errors are retried for GET. POST is only retried where the request
+ cannot have been processed (503 and connect timeouts), so that jobs are not submitted twice.
+"""
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from novametrics.support import rate_limiter
+
+POOL_SIZE = 10
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 1
+MAX_BACKOFF = 120
+RETRY_STATUS_GET = (429, 500, 502, 503, 504)
+RETRY_STATUS_POST = (429, 503)
+# Default (connect, read) timeout in seconds. The read timeout is the longest wait for the next bytes, not for the whole response
+TIMEOUT = (10, 300)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def configure_session(pool_size = POOL_SIZE, max_retries = MAX_RETRIES, backoff_factor = BACKOFF_FACTOR, timeout = TIMEOUT):
+    """
+    (Re)create the shared session
+
+    Parameters
+    ----------
+    pool_size : int
+        Maximum number of kept-alive connections per host.
+    max_retries : int
+        Number of times a failed request is retried.
+    backoff_factor : float
+        Seconds to wait before the first retry. Doubles with each retry.
+    timeout : float or tuple
+        Default (connect, read) timeout in seconds of requests which do not pass their own `timeout`.
+    """
+    global _session, MAX_RETRIES, BACKOFF_FACTOR, TIMEOUT
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = session
+        MAX_RETRIES = max_retries
+        BACKOFF_FACTOR = backoff_factor
+        TIMEOUT = timeout
+    return session
+
+
+def get_session():
+    """Return the shared session, creating it if needed"""
+    if _session is None:
+        configure_session()
+    return _session
+
+
+def retry_delay(attempt, resp = None):
+    """Return seconds to wait before retry number `attempt` (starting at 0) of a request which returned `resp`"""
+    if resp is not None and resp.status_code == 429 and "Retry-After" in resp.headers:
+        try:
+            return min(float(resp.headers["Retry-After"]), MAX_BACKOFF)
+        except ValueError:
+            pass
+    return min(BACKOFF_FACTOR * 2 ** attempt, MAX_BACKOFF)
+
+
+def request(method, url, **kwargs):
+    """
+    Send request through the shared session, retrying rate limited and server errors
+
+    Takes the same keyword arguments as `requests.request` and returns the final `requests.Response`.
+    `timeout` defaults to `TIMEOUT`. Pass timeout=None to wait indefinitely.
+    """
+    kwargs.setdefault("timeout", TIMEOUT)
+    method = method.upper()
+    if method == "GET":
+        retry_status, retry_errors = RETRY_STATUS_GET, (requests.ConnectionError, requests.Timeout)
+    else:
+        retry_status, retry_errors = RETRY_STATUS_POST, (requests.exceptions.ConnectTimeout, )
+    attempt = 0
+    while True:
+        rate_limiter.acquire(url)
+        try:
+            resp = get_session().request(method, url, **kwargs)
+        except retry_errors as e:
+            if attempt >= MAX_RETRIES:
+                raise
+            delay = retry_delay(attempt)
+            print(f"Request to {url.split('?')[0]} failed due to {e}. Retrying in {delay:.0f}s")
+        else:
+            rate_limiter.update(url, resp)
+            if resp.status_code not in retry_status or attempt >= MAX_RETRIES:
+                return resp
+            if resp.status_code == 429 and rate_limiter.get_bucket(rate_limiter.get_host(url)) is not None:
+                # The host's bucket is paused, so the next acquire does the waiting
+                delay = 0
+            else:
+                delay = retry_delay(attempt, resp)
+            print(f"Status code {resp.status_code} from {url.split('?')[0]}. Retrying")
+        time.sleep(delay)
+        attempt += 1
+
+
+def get(url, **kwargs):
+    """Send GET request through the shared session"""
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    """Send POST request through the shared session"""
+    return request("POST", url, **kwargs)
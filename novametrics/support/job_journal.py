@@ -0,0 +1,74 @@
+"""
+Append-only journal of submitted REopt jobs
+
+Each line of the journal is a json entry recording a post path, the post hash, the
+run_uuid it was submitted as, the submit time, the job status ("submitted",
+"complete" or "failed") and the time the entry was written. The latest entry for a
+post path wins. Only jobs which solved with status "optimal" are "complete". If a
+sweep is interrupted or a job exceeds the max wall time, jobs still marked
+"submitted" can be polled again by run_uuid instead of being resubmitted. Solve
+times of complete jobs are used to schedule later sweeps.
+"""
+import os
+import json
+import time
+
+SUBMITTED = "submitted"
+COMPLETE = "complete"
+FAILED = "failed"
+
+
+class JobJournal:
+    """
+    Journal of REopt jobs saved to `journal_file`
+
+    Existing entries are loaded on creation and new entries are appended and flushed
+    to disk as soon as they are recorded.
+    """
+    def __init__(self, journal_file):
+        self.journal_file = journal_file
+        self.entries = {}
+        if os.path.isfile(journal_file):
+            with open(journal_file, "r") as fp:
+                for line in fp:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Last line may be partially written if the process died mid-write
+                        continue
+                    self.entries[entry["post_path"]] = entry
+
+    def record(self, post_path, post_hash, run_uuid, status):
+        """Append entry for `post_path`. Keeps the submit time of an earlier entry for the same run_uuid."""
+        previous = self.entries.get(post_path)
+        if previous is not None and previous["run_uuid"] == run_uuid:
+            submit_time = previous["submit_time"]
+        else:
+            submit_time = time.time()
+        entry = {"post_path": post_path, "hash": post_hash, "run_uuid": run_uuid, "submit_time": submit_time, "status": status,
+                 "time": time.time()}
+        with open(self.journal_file, "a") as fp:
+            fp.write(json.dumps(entry) + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+        self.entries[post_path] = entry
+
+    def outstanding_run_uuid(self, post_path, post_hash):
+        """Return run_uuid if `post_path` was submitted with the same `post_hash` and has not finished, otherwise None"""
+        entry = self.entries.get(post_path)
+        if entry is not None and entry["status"] == SUBMITTED and entry["hash"] == post_hash:
+            return entry["run_uuid"]
+        return None
+
+    def outstanding(self):
+        """Return list of entries for jobs which were submitted but have not finished"""
+        return [entry for entry in self.entries.values() if entry["status"] == SUBMITTED]
+
+    def solve_times(self):
+        """Return dictionary of post file name to list of seconds from submission to completion of each complete (optimal) job"""
+        solve_times = {}
+        for entry in self.entries.values():
+            if entry["status"] == COMPLETE and "time" in entry:
+                post_name = os.path.basename(entry["post_path"])
+                solve_times.setdefault(post_name, []).append(entry["time"] - entry["submit_time"])
+        return solve_times
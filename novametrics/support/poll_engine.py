@@ -0,0 +1,255 @@
+"""
+Single-loop poller for many outstanding REopt jobs
+
+`PollEngine` tracks a set of REopt results urls (one per run_uuid). Each tick polls
+only the jobs which are due, and finished jobs are moved to the `completed` queue
+as (tag, results dictionary, error) tuples for writers to consume.
+One engine can serve thousands of in-flight jobs from a single thread.
+
+`PollPolicy` decides when each job is polled: the first poll is delayed by an estimate
+of solve time from the post size, later polls back off exponentially with jitter, and
+jobs are given up on once they exceed a maximum wall time.
+"""
+import queue
+import random
+import threading
+import time
+from novametrics.support import http_client
+from novametrics.support.utils import loads
+
+
+class PollPolicy:
+    """
+    Polling schedule for a single REopt job, driven by time elapsed since submission
+
+    Parameters
+    ----------
+    initial_interval : float
+        Seconds between the first polls.
+    max_interval : float
+        Upper limit on seconds between polls.
+    backoff : float
+        Factor the interval grows by after each poll that is still "Optimizing...".
+    jitter : float
+        Fraction each interval is randomly stretched or shrunk by, so jobs submitted together do not poll together.
+    max_wall_time : float
+        Seconds after submission at which a job is given up on.
+    first_poll_base : float
+        Seconds before the first poll of a post without RC or HotWaterTank inputs.
+    first_poll_seconds_per_input : float
+        Extra seconds before the first poll per value of RC and HotWaterTank `u_inputs`.
+    max_first_poll : float
+        Upper limit on seconds before the first poll.
+    """
+    def __init__(self, initial_interval = 10, max_interval = 120, backoff = 1.5, jitter = 0.1, max_wall_time = 6*3600,
+                 first_poll_base = 5, first_poll_seconds_per_input = 2e-3, max_first_poll = 600):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.max_wall_time = max_wall_time
+        self.first_poll_base = first_poll_base
+        self.first_poll_seconds_per_input = first_poll_seconds_per_input
+        self.max_first_poll = max_first_poll
+
+    def _jittered(self, seconds):
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def first_poll_delay(self, post = None):
+        """Return seconds to wait after submitting `post` before its first poll"""
+        if post is None:
+            return 0
+        site = post.get("Scenario", {}).get("Site", {})
+        n_inputs = sum(len(site.get(section, {}).get("u_inputs", [])) for section in ["RC", "HotWaterTank"])
+        return self._jittered(min(self.first_poll_base + self.first_poll_seconds_per_input * n_inputs, self.max_first_poll))
+
+    def next_delay(self, elapsed, n_polls):
+        """Return seconds until the next poll of a job which has been polled `n_polls` times over `elapsed` seconds"""
+        interval = min(self.initial_interval * self.backoff ** max(n_polls - 1, 0), self.max_interval)
+        interval = self._jittered(interval)
+        return max(0, min(interval, self.max_wall_time - elapsed))
+
+    def timed_out(self, elapsed):
+        """Return True if a job running for `elapsed` seconds should be given up on"""
+        return elapsed >= self.max_wall_time
+
+
+class PollEngine:
+    """
+    Polls REopt results urls from a single loop until status is not "Optimizing..."
+
+    Jobs given up on (max wall time or KeyError threshold exceeded) are completed with
+    a TimeoutError or KeyError as their error, along with the last response.
+
+    Parameters
+    ----------
+    poll_interval : int
+        Seconds between the first polls of a single job. Ignored if `policy` is given.
+    key_error_threshold : int
+        Number of responses without a status, or which are not json, before a job is given up on.
+    policy : PollPolicy, optional
+        Polling schedule. Defaults to `PollPolicy(initial_interval=poll_interval)`.
+    """
+    def __init__(self, poll_interval = 10, key_error_threshold = 4, policy = None):
+        if policy is None:
+            policy = PollPolicy(initial_interval=poll_interval)
+        self.policy = policy
+        self.key_error_threshold = key_error_threshold
+        self.jobs = {}
+        self.completed = queue.Queue()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, url, tag = None, post = None):
+        """
+        Start tracking results `url`. `tag` is returned with the results once the job finishes.
+        If the submitted `post` is given then it is used to estimate when to first poll.
+        """
+        now = time.monotonic()
+        first_poll = self.policy.first_poll_delay(post)
+        with self._lock:
+            self.jobs[url] = {"tag": tag, "submitted": now, "next_poll": now + first_poll, "n_polls": 0,
+                              "key_error_count": 0, "status": "Optimizing...", "final": False}
+        print("Polling {} for results in {:.0f}s with initial interval of {}s...".format(url, first_poll, self.policy.initial_interval))
+        self._wake.set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self.jobs)
+
+    def poll(self, url, job):
+        """
+        Poll a single job once. Returns True if the job is finished.
+
+        Responses without a status, or whose body is not json (e.g. an html error page or a truncated body),
+        are polled again with backoff. Raises KeyError (or ValueError for bodies which are not json) once more
+        than `key_error_threshold` such responses are returned, and TimeoutError if the job is still
+        "Optimizing..." after the max wall time.
+        """
+        resp = http_client.get(url=url, verify=False)
+        job["n_polls"] += 1
+        try:
+            resp_dict = loads(resp.content)
+        except ValueError as e:
+            job["key_error_count"] += 1
+            print('Could not decode response with status code {} from {}. Bad response count: {}'.format(resp.status_code, url, job["key_error_count"]))
+            if job["key_error_count"] > self.key_error_threshold:
+                print('Breaking polling loop due to bad response count threshold of {} exceeded.'.format(self.key_error_threshold))
+                raise ValueError(f"Response with status code {resp.status_code} is not json: {e}") from e
+            return self._reschedule(url, job)
+        job["resp_dict"] = resp_dict
+
+        if job["final"]:
+            return True
+        try:
+            job["status"] = resp_dict['outputs']['Scenario']['status']
+        except KeyError as e:
+            job["key_error_count"] += 1
+            print('KeyError count: {}'.format(job["key_error_count"]))
+            if job["key_error_count"] > self.key_error_threshold:
+                print('Breaking polling loop due to KeyError count threshold of {} exceeded.'.format(self.key_error_threshold))
+                raise KeyError(f"No status in {job['key_error_count']} responses, last missing key {e}") from e
+
+        if job["status"] != "Optimizing...":
+            if "Site" in resp_dict['outputs']['Scenario']:
+                return True
+            # Results can lag the status on slower servers. Fetch once more after the initial interval
+            job["final"] = True
+            job["next_poll"] = time.monotonic() + self.policy.initial_interval
+            return False
+        return self._reschedule(url, job)
+
+    def _reschedule(self, url, job):
+        """Set time of the next poll of an unfinished job. Raises TimeoutError if it has run past the max wall time."""
+        elapsed = time.monotonic() - job["submitted"]
+        if self.policy.timed_out(elapsed):
+            print('Breaking polling loop for {} due to max wall time of {}s exceeded.'.format(url, self.policy.max_wall_time))
+            raise TimeoutError(f"Max wall time of {self.policy.max_wall_time}s exceeded")
+        job["next_poll"] = time.monotonic() + self.policy.next_delay(elapsed, job["n_polls"])
+        return False
+
+    def tick(self):
+        """
+        Poll every job which is due and move finished jobs to the completion queue.
+
+        Returns
+        -------
+        float or None
+            Seconds until the next job is due, or None if no jobs are outstanding.
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = [(url, job) for url, job in self.jobs.items() if job["next_poll"] <= now]
+
+        for url, job in due:
+            error = None
+            try:
+                finished = self.poll(url, job)
+            except Exception as e:
+                print(f"Polling {url} failed due to {e}")
+                error = e
+                finished = True
+            if finished:
+                with self._lock:
+                    del self.jobs[url]
+                self.completed.put((job["tag"], job.get("resp_dict"), error))
+
+        with self._lock:
+            if len(self.jobs) == 0:
+                return None
+            return max(0, min(job["next_poll"] for job in self.jobs.values()) - time.monotonic())
+
+    def run(self):
+        """Poll until all outstanding jobs are finished."""
+        while True:
+            wait = self.tick()
+            if wait is None:
+                return
+            time.sleep(wait)
+
+    def _serve(self):
+        while not self._stop.is_set():
+            wait = self.tick()
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def start(self):
+        """Poll in a background thread until `stop` is called. Jobs may be added at any time."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background polling thread."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def poll_until_complete(url, poll_interval = 10, post = None, policy = None):
+    """
+    Poll a single REopt results `url` until status is not "Optimizing..."
+
+    `post` and `policy` are passed to `PollEngine` to set the polling schedule.
+
+    Returns
+    -------
+    dict
+        Dictionary response (once status is not "Optimizing...")
+
+    Raises
+    ------
+    TimeoutError
+        If the job is still "Optimizing..." after the max wall time of `policy`.
+    """
+    engine = PollEngine(poll_interval, policy=policy)
+    engine.add(url, post=post)
+    engine.run()
+    tag, resp_dict, error = engine.completed.get()
+    if error is not None:
+        raise error
+    return resp_dict
@@ -0,0 +1,86 @@
+"""
+Orders queued REopt posts by priority and estimated solve time
+
+Posts are run highest priority first, then shortest estimated solve time first, so that a
+few large RC and HotWaterTank posts do not hold up many cheap PV and storage posts and
+the first complete sets of metrics are available sooner.
+
+Solve time is estimated from past solve times of posts with the same file name (from the
+job journal) where available. Otherwise it is estimated from the post file without parsing
+it: posts with RC or FlexTech sections cost more, and file size stands in for the length
+of the `u_inputs` series.
+"""
+import os
+import fnmatch
+
+BASE_SECONDS = 30
+RC_SECONDS = 120
+FLEXTECH_SECONDS = 30
+SECONDS_PER_MB = 60
+
+
+def estimate_post_seconds(post_path, solve_times = {}):
+    """
+    Return estimated seconds to solve post saved at `post_path`
+
+    Parameters
+    ----------
+    post_path : str
+        Path to post json.
+    solve_times : dict
+        Dictionary of post file name to list of past solve times in seconds, such as from `JobJournal.solve_times`.
+    """
+    post_name = os.path.basename(post_path)
+    if len(solve_times.get(post_name, [])) > 0:
+        return sum(solve_times[post_name]) / len(solve_times[post_name])
+
+    with open(post_path, "rb") as fp:
+        data = fp.read()
+    seconds = BASE_SECONDS + SECONDS_PER_MB * len(data) / 1e6
+    if b'"RC"' in data or b'"HotWaterTank"' in data:
+        seconds += RC_SECONDS
+    seconds += FLEXTECH_SECONDS * data.count(b'"FlexTech')
+    return seconds
+
+
+def get_priority(post_path, priorities = {}):
+    """
+    Return priority of post saved at `post_path`
+
+    `priorities` maps glob patterns matched against the post path (relative or absolute) to
+    priorities. The highest priority of all matching patterns is returned, or 0 if none match.
+    """
+    matches = [priority for pattern, priority in priorities.items()
+               if fnmatch.fnmatch(post_path, pattern) or fnmatch.fnmatch(os.path.basename(post_path), pattern)]
+    return max(matches, default=0)
+
+
+def schedule_jobs(jobs, reopt_workers = 1, priorities = {}, solve_times = {}):
+    """
+    Return `jobs`, a list of (post_dir, results_dir, post_name) tuples, in the order they should be submitted
+
+    Jobs are ordered by descending priority and then ascending estimated solve time.
+    Prints the estimated time to finish all jobs with `reopt_workers` jobs in flight.
+    """
+    keyed_jobs = []
+    for job in jobs:
+        post_path = os.path.join(job[0], job[2])
+        keyed_jobs.append((-get_priority(post_path, priorities), estimate_post_seconds(post_path, solve_times), job))
+    keyed_jobs.sort(key=lambda k: (k[0], k[1]))
+
+    # Plan finish times by assigning each job to the first free slot
+    slots = [0] * max(reopt_workers, 1)
+    for _, seconds, _ in keyed_jobs:
+        i = slots.index(min(slots))
+        slots[i] += seconds
+    print(f"Scheduled {len(jobs)} REopt posts. Estimated time to run is {max(slots, default=0)/60:.1f} minutes")
+    return [k[2] for k in keyed_jobs]
+
+
+def parse_priorities(priority_args):
+    """Return priorities dictionary from list of "pattern=priority" strings, e.g. ["*baseline*=10"]"""
+    priorities = {}
+    for arg in priority_args:
+        pattern, priority = arg.rsplit("=", 1)
+        priorities[pattern] = float(priority)
+    return priorities
@@ -0,0 +1,143 @@
+"""
+Per-host token bucket rate limiting for API calls
+
+Every request made through `http_client` takes a token from the bucket for its host
+first, so REopt submits and polls, PVWatts and URDB calls share one budget per host.
+Buckets refill at the host's hourly request limit. The limit and the number of requests
+remaining are read from the X-RateLimit-Limit and X-RateLimit-Remaining response headers
+(as sent by developer.nrel.gov), so pacing follows the key's real quota. A limit set with
+`configure_host` is a cap: the header only lowers it, so a self-imposed limit below the
+key's quota (e.g. shared across machines) is kept.
+Hosts without a configured limit are not limited until they send rate limit headers.
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Default hourly limit of an NREL developer API key
+DEFAULT_LIMITS = {"developer.nrel.gov": 1000}
+DEFAULT_BURST = 60
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    Parameters
+    ----------
+    requests_per_hour : float
+        Rate the bucket refills at.
+    burst : int
+        Maximum number of tokens the bucket holds, i.e. requests that can be sent back to back.
+    max_requests_per_hour : float, optional
+        Cap on the rate `set_limit` can set. Defaults to no cap.
+    """
+    def __init__(self, requests_per_hour, burst = DEFAULT_BURST, max_requests_per_hour = None):
+        self.max_requests_per_hour = max_requests_per_hour
+        self.rate = requests_per_hour / 3600
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until a token is available and take it. Returns seconds spent waiting."""
+        waited = 0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+            waited += wait
+
+    def set_limit(self, requests_per_hour):
+        """Set refill rate to `requests_per_hour`, or `max_requests_per_hour` if that is lower"""
+        if self.max_requests_per_hour is not None:
+            requests_per_hour = min(requests_per_hour, self.max_requests_per_hour)
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = requests_per_hour / 3600
+
+    def set_remaining(self, remaining):
+        """Lower tokens to the number of requests the server says remain"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, remaining)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds`, e.g. after a 429 response"""
+        with self._lock:
+            self.tokens = 0
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_host(url):
+    return urlsplit(url).hostname or ""
+
+
+def configure_host(host, requests_per_hour, burst = DEFAULT_BURST):
+    """Set the hourly request limit for `host`. Rate limit headers of the host can lower it but not raise it."""
+    with _buckets_lock:
+        _buckets[host] = TokenBucket(requests_per_hour, burst, max_requests_per_hour=requests_per_hour)
+
+
+def get_bucket(host):
+    """Return the bucket for `host`, or None if the host is not limited"""
+    with _buckets_lock:
+        if host not in _buckets and host in DEFAULT_LIMITS:
+            _buckets[host] = TokenBucket(DEFAULT_LIMITS[host])
+        return _buckets.get(host)
+
+
+def acquire(url):
+    """Wait until a request to `url` is allowed"""
+    bucket = get_bucket(get_host(url))
+    if bucket is not None:
+        waited = bucket.acquire()
+        if waited > 1:
+            print(f"Waited {waited:.0f}s for rate limit of {get_host(url)}")
+
+
+def update(url, resp, retry_after = 60):
+    """Update the bucket for `url` from the rate limit headers and status of `resp`"""
+    host = get_host(url)
+    headers = resp.headers
+    if "X-RateLimit-Limit" in headers:
+        try:
+            limit = float(headers["X-RateLimit-Limit"])
+        except ValueError:
+            limit = None
+        if limit is not None:
+            bucket = get_bucket(host)
+            if bucket is None:
+                with _buckets_lock:
+                    _buckets.setdefault(host, TokenBucket(limit))
+            else:
+                bucket.set_limit(limit)
+    bucket = get_bucket(host)
+    if bucket is None:
+        return
+    if "X-RateLimit-Remaining" in headers:
+        try:
+            bucket.set_remaining(float(headers["X-RateLimit-Remaining"]))
+        except ValueError:
+            pass
+    if resp.status_code == 429:
+        try:
+            retry_after = float(headers.get("Retry-After", retry_after))
+        except ValueError:
+            pass
+        bucket.pause(retry_after)
@@ -0,0 +1,266 @@
+"""
+Local stand-in for the REopt API /v1/job/ endpoints
+
+`ReoptStandIn` serves POST /v1/job/ and GET /v1/job/<run_uuid>/results/ on localhost
+so that the REopt runner can be load tested without a live REopt deployment. Solve
+latency, failure rate and result payload size are configurable. Results are canned
+values built from the post, shaped like the REopt results `extract_results` reads.
+RC and HotWaterTank temperatures are simulated from the post's RC matrices and inputs, so
+that changes to those arrays show up in the results.
+GET /v1/stats/ returns the number of submits and polls received.
+
+The stand-in can also be run in its own process, which keeps its work off the runner's GIL:
+    python -m novametrics.support.reopt_stand_in --port 8000 --solve_seconds 5
+
+Example
+-------
+    stand_in = ReoptStandIn(solve_seconds=2)
+    root_url = stand_in.start()
+    run_reopt(post_folder, results_folder, "key", root_url=root_url)
+    stand_in.stop()
+"""
+import json
+import random
+import argparse
+import threading
+import time
+import uuid
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HOURS = 8760
+STEP_SECONDS = 3600
+# Post sections with RC models, and the key of the node whose temperatures are reported
+RC_SECTIONS = {"RC": "space_node", "HotWaterTank": "water_node"}
+
+
+def get_series(d, name, default):
+    series = d.get(name)
+    if series is None or len(series) != HOURS:
+        return [default]*HOURS
+    return series
+
+
+def simulate_rc(rc, node_key):
+    """
+    Return hourly temperatures of node `node_key` of post RC section `rc`
+
+    The RC model dT/dt = A T + B u is stepped hourly with backward Euler from the initial temperatures,
+    with A and B per second. Matrices and inputs are flattened column by column, as `flatten_columns` writes them.
+    """
+    n_temp_nodes, n_input_nodes = int(rc["n_temp_nodes"]), int(rc["n_input_nodes"])
+    a_matrix = np.reshape(rc["a_matrix"], (n_temp_nodes, n_temp_nodes), order="F")
+    b_matrix = np.reshape(rc["b_matrix"], (n_temp_nodes, n_input_nodes), order="F")
+    u_inputs = np.reshape(rc["u_inputs"], (-1, n_input_nodes), order="F")
+    init_temperatures = rc.get("init_temperatures", rc.get("init_temperatures_degC"))
+    temperatures = np.asarray(init_temperatures, dtype=float) if init_temperatures is not None else np.zeros(n_temp_nodes)
+    step = np.linalg.inv(np.eye(n_temp_nodes) - STEP_SECONDS * a_matrix)
+    forcing = STEP_SECONDS * u_inputs @ b_matrix.T
+    node = int(rc[node_key]) - 1
+    series = []
+    for t in range(len(u_inputs)):
+        temperatures = step @ (temperatures + forcing[t])
+        series.append(float(temperatures[node]))
+    return series
+
+
+def solve(post, run_uuid, extra_series = 0):
+    """
+    Return canned REopt results for `post`
+
+    Loads are taken from LoadProfile `loads_kw` (flat 1 kW if missing) and PV production
+    from PV `prod_factor_series_kw`. PV is sized to half of the average load and all
+    PV production is used onsite. No storage is built. RC and HotWaterTank sections are
+    simulated with `simulate_rc`.
+    `extra_series` adds that many 8760 series to the outputs to grow the payload.
+    """
+    site = post.get("Scenario", {}).get("Site", {})
+    loads = get_series(site.get("LoadProfile", {}), "loads_kw", 1.0)
+    prod_factor = get_series(site.get("PV", {}), "prod_factor_series_kw", 0.0)
+
+    pv_kw = round(sum(loads) / HOURS / 2, 4)
+    pv_production = [pv_kw * p for p in prod_factor]
+    pv_to_load = [min(p, l) for p, l in zip(pv_production, loads)]
+    pv_to_grid = [p - l for p, l in zip(pv_production, pv_to_load)]
+    grid_to_load = [l - p for l, p in zip(loads, pv_to_load)]
+    zeros = [0.0]*HOURS
+    energy_price = 0.1
+    energy_cost = sum(grid_to_load) * energy_price
+    pv_cost_per_kw = site.get("PV", {}).get("installed_cost_us_dollars_per_kw", 1600)
+
+    inputs = json.loads(json.dumps(post))
+    inputs_site = inputs.setdefault("Scenario", {}).setdefault("Site", {})
+    inputs_site.setdefault("latitude", 0)
+    inputs_site.setdefault("longitude", 0)
+    inputs_site.setdefault("PV", {}).setdefault("installed_cost_us_dollars_per_kw", pv_cost_per_kw)
+    inputs_site["PV"]["prod_factor_series_kw"] = prod_factor
+    inputs_site.setdefault("Storage", {}).setdefault("installed_cost_us_dollars_per_kw", 840)
+    inputs_site["Storage"].setdefault("installed_cost_us_dollars_per_kwh", 420)
+
+    outputs_site = {
+        "PV": {"size_kw": pv_kw, "year_one_power_production_series_kw": pv_production, "year_one_to_load_series_kw": pv_to_load,
+               "year_one_to_grid_series_kw": pv_to_grid, "year_one_to_battery_series_kw": zeros},
+        "Storage": {"size_kw": 0, "size_kwh": 0, "year_one_to_load_series_kw": zeros, "year_one_to_grid_series_kw": zeros,
+                    "year_one_soc_series_pct": zeros},
+        "ElectricTariff": {"year_one_to_load_series_kw": grid_to_load, "year_one_to_battery_series_kw": zeros,
+                           "year_one_bill_us_dollars": energy_cost, "year_one_energy_cost_us_dollars": energy_cost,
+                           "year_one_demand_cost_us_dollars": 0, "total_energy_cost_us_dollars": energy_cost * 20,
+                           "year_one_energy_cost_series_us_dollars_per_kwh": [energy_price]*HOURS,
+                           "year_one_demand_cost_series_us_dollars_per_kw": zeros,
+                           "total_fixed_cost_us_dollars": 0, "total_min_charge_adder_us_dollars": 0,
+                           "total_coincident_peak_cost_us_dollars": 0, "total_coincident_peak_cost_bau_us_dollars": 0,
+                           "total_export_benefit_us_dollars": 0},
+        "Financial": {"lcc_us_dollars": energy_cost * 20 + pv_kw * pv_cost_per_kw, "net_capital_costs": pv_kw * pv_cost_per_kw,
+                      "initial_capital_costs": pv_kw * pv_cost_per_kw, "total_om_costs_us_dollars": 0},
+        "year_one_emissions_tCO2": sum(grid_to_load) * 0.0004,
+        "lifecycle_emissions_tCO2": sum(grid_to_load) * 0.0004 * 20,
+        "outdoor_air_temp_degF": [],
+    }
+    for section, node_key in RC_SECTIONS.items():
+        if all(k in site.get(section, {}) for k in ("a_matrix", "b_matrix", "u_inputs")):
+            outputs_site[section] = {"temperatures_degC": simulate_rc(site[section], node_key)}
+    if extra_series > 0:
+        outputs_site["StandIn"] = {f"series_{i}": [random.random() for h in range(HOURS)] for i in range(extra_series)}
+
+    return {"inputs": inputs, "outputs": {"Scenario": {"status": "optimal", "run_uuid": run_uuid, "Site": outputs_site}}}
+
+
+def failed_results(post, run_uuid):
+    """Return REopt response for a job which failed to solve"""
+    site = post.get("Scenario", {}).get("Site", {})
+    inputs = {"Scenario": {"Site": {"latitude": site.get("latitude", 0), "longitude": site.get("longitude", 0)}}}
+    return {"inputs": inputs, "outputs": {"Scenario": {"status": "error", "run_uuid": run_uuid}},
+            "messages": {"error": "Stand-in solve failure"}}
+
+
+class ReoptStandIn:
+    """
+    Local REopt API stand-in server
+
+    Parameters
+    ----------
+    solve_seconds : float
+        Seconds from submission until a job is solved.
+    solve_jitter : float
+        Fraction `solve_seconds` is randomly stretched or shrunk by for each job.
+    failure_rate : float
+        Fraction of jobs which finish with status "error".
+    extra_series : int
+        Number of extra 8760 series added to each result to grow the payload.
+    port : int
+        Port to serve on. Defaults to any free port.
+    """
+    def __init__(self, solve_seconds = 5, solve_jitter = 0, failure_rate = 0, extra_series = 0, port = 0):
+        self.solve_seconds = solve_seconds
+        self.solve_jitter = solve_jitter
+        self.failure_rate = failure_rate
+        self.extra_series = extra_series
+        self.port = port
+        self.jobs = {}
+        self.n_submits = 0
+        self.n_polls = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def root_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def submit(self, post):
+        run_uuid = str(uuid.uuid4())
+        solve_seconds = self.solve_seconds * random.uniform(1 - self.solve_jitter, 1 + self.solve_jitter)
+        with self._lock:
+            self.n_submits += 1
+            self.jobs[run_uuid] = {"post": post, "submitted": time.time(), "solved": time.time() + solve_seconds,
+                                   "failed": random.random() < self.failure_rate, "results": None}
+        return run_uuid
+
+    def results(self, run_uuid):
+        with self._lock:
+            self.n_polls += 1
+            job = self.jobs.get(run_uuid)
+        if job is None:
+            return None
+        if time.time() < job["solved"]:
+            return {"outputs": {"Scenario": {"status": "Optimizing...", "run_uuid": run_uuid}}}
+        if job["results"] is None:
+            if job["failed"]:
+                job["results"] = failed_results(job["post"], run_uuid)
+            else:
+                job["results"] = solve(job["post"], run_uuid, self.extra_series)
+            # Lets benchmarks measure time from completion to results being written
+            job["results"]["outputs"]["Scenario"]["stand_in_solved_time"] = job["solved"]
+        return job["results"]
+
+    def start(self):
+        """Serve in a background thread and return the root url to pass to `run_reopt`"""
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def send_json(self, d, status = 200):
+                body = json.dumps(d).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if not self.path.startswith("/v1/job/"):
+                    return self.send_json({"error": "Not found"}, 404)
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    post = json.loads(self.rfile.read(length))
+                except ValueError:
+                    return self.send_json({"messages": {"input_errors": ["Post is not valid json"]}}, 400)
+                self.send_json({"run_uuid": stand_in.submit(post)}, 201)
+
+            def do_GET(self):
+                parts = self.path.split("?")[0].strip("/").split("/")
+                if parts == ["v1", "stats"]:
+                    return self.send_json({"submits": stand_in.n_submits, "polls": stand_in.n_polls})
+                if len(parts) != 4 or parts[:2] != ["v1", "job"] or parts[3] != "results":
+                    return self.send_json({"error": "Not found"}, 404)
+                results = stand_in.results(parts[2])
+                if results is None:
+                    return self.send_json({"messages": {"error": f"run_uuid {parts[2]} not found"}}, 404)
+                self.send_json(results)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.root_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the REopt API.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to serve on.")
+    parser.add_argument("--solve_seconds", type=float, default=5, help="Mean solve latency in seconds.")
+    parser.add_argument("--solve_jitter", type=float, default=0, help="Fraction solve latency varies by between jobs.")
+    parser.add_argument("--failure_rate", type=float, default=0, help="Fraction of jobs which fail to solve.")
+    parser.add_argument("--extra_series", type=int, default=0, help="Extra 8760 series added to each result to grow the payload.")
+    args = parser.parse_args()
+    stand_in = ReoptStandIn(args.solve_seconds, args.solve_jitter, args.failure_rate, args.extra_series, args.port)
+    print(f"Serving REopt stand-in at {stand_in.start()}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stand_in.stop()
+
+
+if __name__ == "__main__":
+    main()
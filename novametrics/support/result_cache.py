@@ -0,0 +1,175 @@
+"""
+Local cache of REopt results keyed by a canonical hash of the post
+
+Posts are hashed with sorted keys and floats normalized to 12 significant digits, so
+identical posts always hit the same entry no matter how they were written. Entries are
+evicted least recently used first once the cache grows past `max_size_gb`.
+
+The cache can be inspected and pruned from the command line with `nova_cache`.
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+from novametrics.support.utils import dumps, loads
+
+DEFAULT_CACHE_FOLDER = "reopt_cache"
+FLOAT_DIGITS = 12
+# Fraction of the maximum size a full cache is pruned down to, so pruning is not repeated on every put
+PRUNE_FRACTION = 0.9
+
+
+def normalize(val):
+    """Return copy of `val` with floats rounded to `FLOAT_DIGITS` significant digits and integral floats made ints"""
+    if isinstance(val, float):
+        if val != val or val in (float("inf"), float("-inf")):
+            return str(val)
+        val = float(format(val, f".{FLOAT_DIGITS}g"))
+        if val.is_integer():
+            return int(val)
+        return val
+    elif isinstance(val, dict):
+        return {str(k): normalize(v) for k, v in val.items()}
+    elif isinstance(val, (list, tuple)):
+        return [normalize(v) for v in val]
+    else:
+        return val
+
+
+def post_hash(post, root_url = ""):
+    """Return sha256 hex digest of canonical form of `post` as sent to `root_url`"""
+    canonical = json.dumps({"root_url": root_url, "post": normalize(post)}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Size-bounded store of REopt results on disk
+
+    Parameters
+    ----------
+    cache_folder : str
+        Folder where results are saved. Created if needed.
+    max_size_gb : float
+        Least recently used results are evicted once the cache is larger than this.
+
+    The cache size is listed once, on the first `put`, and then kept as a running total. Results are
+    only pruned when a `put` takes the total past `max_size_gb`, and then down to `PRUNE_FRACTION` of it.
+    """
+    def __init__(self, cache_folder = DEFAULT_CACHE_FOLDER, max_size_gb = 5):
+        self.cache_folder = cache_folder
+        self.max_size_bytes = max_size_gb * 1e9
+        self._total_bytes = None
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_folder, key + ".json")
+
+    def get(self, key):
+        """Return cached results for `key`, or None if not cached"""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as fp:
+                results = loads(fp.read())
+        except (OSError, ValueError):
+            return None
+        # mtime records last use for eviction
+        os.utime(path)
+        return results
+
+    def put(self, key, results):
+        """Save `results` under `key`. Only optimal results are cached."""
+        try:
+            status = results["outputs"]["Scenario"]["status"]
+        except (KeyError, TypeError):
+            return
+        if status != "optimal":
+            return
+        if self._total_bytes is None:
+            self._total_bytes = self.size()
+        path = self.path(key)
+        try:
+            self._total_bytes -= os.path.getsize(path)
+        except OSError:
+            pass
+        data = dumps(results)
+        temp_path = path + f".{os.getpid()}.tmp"
+        with open(temp_path, "wb") as fp:
+            fp.write(data)
+        os.replace(temp_path, path)
+        self._total_bytes += len(data)
+        if self._total_bytes > self.max_size_bytes:
+            self.prune(self.max_size_bytes * PRUNE_FRACTION)
+
+    def entries(self):
+        """Return list of (key, size in bytes, last used time) for each cached result, least recently used first"""
+        entries = []
+        for f in os.listdir(self.cache_folder):
+            if f.endswith(".json"):
+                stat = os.stat(os.path.join(self.cache_folder, f))
+                entries.append((f[:-len(".json")], stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda e: e[2])
+
+    def size(self):
+        """Return total size of cached results in bytes"""
+        return sum(e[1] for e in self.entries())
+
+    def prune(self, max_size_bytes = None, older_than_days = None):
+        """
+        Evict least recently used results until cache is under `max_size_bytes`, and evict
+        any result not used in `older_than_days`. Returns number of results evicted.
+        """
+        if max_size_bytes is None:
+            max_size_bytes = self.max_size_bytes
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        cutoff = None if older_than_days is None else time.time() - older_than_days * 86400
+        n_evicted = 0
+        for key, size, last_used in entries:
+            if total <= max_size_bytes and (cutoff is None or last_used >= cutoff):
+                break
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                continue
+            total -= size
+            n_evicted += 1
+        self._total_bytes = total
+        return n_evicted
+
+    def clear(self):
+        """Remove all cached results"""
+        return self.prune(max_size_bytes=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and prune the local REopt results cache.")
+    parser.add_argument("command", choices=["info", "list", "prune", "clear"], help="info: summary, list: each cached result, prune: evict results, clear: remove all results.")
+    parser.add_argument("-c", "--cache_folder", default=DEFAULT_CACHE_FOLDER, help="Path to cache folder. Defaults to reopt_cache.")
+    parser.add_argument("--max_size_gb", type=float, default=None, help="For prune, evict least recently used results until cache is under this size.")
+    parser.add_argument("--older_than_days", type=float, default=None, help="For prune, evict results not used in this many days.")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.cache_folder):
+        print(f"No cache found at {args.cache_folder}")
+        return
+    cache = ResultCache(args.cache_folder)
+
+    if args.command == "info":
+        entries = cache.entries()
+        print(f"{args.cache_folder}: {len(entries)} results, {sum(e[1] for e in entries)/1e6:.1f} MB")
+        if len(entries) > 0:
+            print(f"Least recently used {time.ctime(entries[0][2])}, most recently used {time.ctime(entries[-1][2])}")
+    elif args.command == "list":
+        for key, size, last_used in cache.entries():
+            print(f"{key}  {size/1e6:8.2f} MB  {time.ctime(last_used)}")
+    elif args.command == "prune":
+        max_size_bytes = float("inf") if args.max_size_gb is None else args.max_size_gb * 1e9
+        print(f"Evicted {cache.prune(max_size_bytes, args.older_than_days)} results")
+    elif args.command == "clear":
+        print(f"Removed {cache.clear()} results")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Compact storage of REopt results
+
+REopt results hold dozens of 8760 series, so pretty-printed results jsons make up most
+of a sweep's disk use. `save_results` writes results as compact json compressed with
+gzip, next to where the plain json would have been (e.g. "post.json.gz" for "post.json").
+`load_results` reads either form, so results folders written before compression was
+added, or with it turned off, still load.
+
+Existing results folders can be converted from the command line with `nova_results`:
+    nova_results convert path/to/reopt_results
+    nova_results convert path/to/reopt_results --decompress
+"""
+import os
+import gzip
+import argparse
+from novametrics.support.utils import dumps, loads
+
+COMPRESSED_EXTENSION = ".gz"
+COMPRESS_LEVEL = 6
+
+
+def results_path(path, filename):
+    """
+    Return path to results `filename` in `path`, whether saved plain or compressed
+
+    If both exist the most recently written is returned. If neither exists the plain path is returned.
+    """
+    plain = os.path.join(path, strip_compressed_extension(filename))
+    compressed = plain + COMPRESSED_EXTENSION
+    if os.path.isfile(compressed):
+        if os.path.isfile(plain) and os.path.getmtime(plain) > os.path.getmtime(compressed):
+            return plain
+        return compressed
+    return plain
+
+
+def results_exist(path, filename):
+    return os.path.isfile(results_path(path, filename))
+
+
+def strip_compressed_extension(filename):
+    if filename.endswith(COMPRESSED_EXTENSION):
+        return filename[:-len(COMPRESSED_EXTENSION)]
+    return filename
+
+
+def strip_results_extension(filename):
+    """Return `filename` without its ".json" or ".json.gz" extension"""
+    filename = strip_compressed_extension(filename)
+    if filename.endswith(".json"):
+        return filename[:-len(".json")]
+    return filename
+
+
+def load_results(path, filename):
+    """Load REopt results `filename` from `path`, reading the compressed copy if there is one"""
+    full_path = results_path(path, filename)
+    if full_path.endswith(COMPRESSED_EXTENSION):
+        with gzip.open(full_path, "rb") as fp:
+            return loads(fp.read())
+    with open(full_path, "rb") as fp:
+        return loads(fp.read())
+
+
+def save_results(results, path, filename, compress = True):
+    """
+    Save REopt results to `path` as `filename`, with `COMPRESSED_EXTENSION` added if `compress` is True
+
+    Results are written to a temporary file and moved into place, and any copy in the other
+    format is removed so that `load_results` never reads stale results.
+    """
+    plain = os.path.join(path, strip_compressed_extension(filename))
+    compressed = plain + COMPRESSED_EXTENSION
+    target, stale = (compressed, plain) if compress else (plain, compressed)
+    data = dumps(results)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    if compress:
+        with open(tmp, "wb") as fp:
+            # mtime=0 so identical results give identical files
+            with gzip.GzipFile(fileobj=fp, mode="wb", compresslevel=COMPRESS_LEVEL, mtime=0) as gz:
+                gz.write(data)
+    else:
+        with open(tmp, "wb") as fp:
+            fp.write(data)
+    os.replace(tmp, target)
+    if os.path.isfile(stale):
+        os.remove(stale)
+    return target
+
+
+def list_results(results_folder):
+    """Return paths to all results files (plain or compressed) in `results_folder` and its subfolders"""
+    paths = []
+    for root, dirs, files in os.walk(results_folder):
+        for f in files:
+            if f.endswith(".json") or f.endswith(".json" + COMPRESSED_EXTENSION):
+                paths.append(os.path.join(root, f))
+    return sorted(paths)
+
+
+def convert_results_folder(results_folder, compress = True):
+    """
+    Rewrite all results in `results_folder` compressed (or plain if `compress` is False)
+
+    Returns
+    -------
+    tuple
+        Number of files converted, total bytes before and total bytes after.
+    """
+    n_converted, bytes_before, bytes_after = 0, 0, 0
+    for path in list_results(results_folder):
+        if path.endswith(COMPRESSED_EXTENSION) == compress:
+            continue
+        path_dir, file_name = os.path.split(path)
+        bytes_before += os.path.getsize(path)
+        try:
+            results = load_results(path_dir, file_name)
+        except ValueError as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        new_path = save_results(results, path_dir, file_name, compress)
+        bytes_after += os.path.getsize(new_path)
+        n_converted += 1
+    return n_converted, bytes_before, bytes_after
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert REopt results folders between plain and compressed results.")
+    parser.add_argument("command", choices=["convert"], help="convert: rewrite all results in the folder.")
+    parser.add_argument("results_folder", help="Path to REopt results folder (subfolders are included).")
+    parser.add_argument("--decompress", action="store_true", help="Write plain json instead of compressed results.")
+    args = parser.parse_args()
+
+    n_converted, bytes_before, bytes_after = convert_results_folder(args.results_folder, compress=not args.decompress)
+    print(f"Converted {n_converted} results files from {bytes_before/1e6:.1f} MB to {bytes_after/1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
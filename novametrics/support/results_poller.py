@@ -1,7 +1,7 @@
-import requests
+from novametrics.support import http_client
 import json
-import time
 from timeit import default_timer as timer
+from novametrics.support.poll_engine import poll_until_complete
 #import matplotlib.pyplot as plt
 #import matplotlib.gridspec as gridspec
 
@@ -10,36 +10,11 @@ def poller(url, poll_interval=10):
     """
     Function for polling the REopt API results URL until status is not "Optimizing..."
     :param url: results url to poll
-    :param poll_interval: seconds
+    :param poll_interval: seconds between the first polls; later polls back off
     :return: dictionary response (once status is not "Optimizing...")
     """
     start = timer()
-    key_error_count = 0
-    key_error_threshold = 4
-    status = "Optimizing..."
-    print("Polling {} for results with interval of {}s...".format(url, poll_interval))
-    while True:
-
-        resp = requests.get(url=url, verify=False)
-        resp_dict = json.loads(resp.text)
-
-        try:
-            status = resp_dict['outputs']['Scenario']['status']
-        except KeyError:
-            key_error_count += 1
-            print('KeyError count: {}'.format(key_error_count))
-            if key_error_count > key_error_threshold:
-                print('Breaking polling loop due to KeyError count threshold of {} exceeded.'.format(key_error_threshold))
-                break
-
-        if status != "Optimizing...":
-            time.sleep(10)
-            resp = requests.get(url=url, verify=False)
-            resp_dict = json.loads(resp.text)
-            break
-        else:
-            time.sleep(poll_interval)
-            
+    resp_dict = poll_until_complete(url, poll_interval)
     end = timer()
     print('API call took', (end - start)/60, 'minutes')
     
@@ -51,7 +26,7 @@ def reo_optimize(post):
     post_url = root_url + '/v1/job/?api_key=' + API_KEY
     results_url = root_url + '/v1/job/<run_uuid>/results/?api_key=' + API_KEY
 
-    resp = requests.post(url=post_url, json=post)
+    resp = http_client.post(url=post_url, json=post)
 
     if not resp.ok:
         print("Status code {}. {}".format(resp.status_code, resp.content))
@@ -72,7 +47,7 @@ def reo_optimize_chpstaging(post):
     post_url = root_url + '/v1/job/?format=json&api_key=' + API_KEY
     results_url = root_url + '/v1/job/<run_uuid>/results/?api_key=' + API_KEY
 
-    resp = requests.post(url=post_url, json=post)
+    resp = http_client.post(url=post_url, json=post)
 
     if not resp.ok:
         print("Status code {}. {}".format(resp.status_code, resp.content))
@@ -91,7 +66,7 @@ def reo_inputs():
     root_url = 'http://localhost:8000'
     post_url = root_url + '/v1/help'
     
-    resp = requests.post(url=post_url)
+    resp = http_client.post(url=post_url)
 
     if not resp.ok:
         print("Status code {}. {}".format(resp.status_code, resp.content))
@@ -107,7 +82,7 @@ def reo_optimize_localhost(post):
     post_url = root_url + '/v1/job/?format=json&api_key=' + API_KEY
     results_url = root_url + '/v1/job/<run_uuid>/results/?api_key=' + API_KEY
 
-    resp = requests.post(url=post_url, json=post)
+    resp = http_client.post(url=post_url, json=post)
 
     if not resp.ok:
         print("Status code {}. {}".format(resp.status_code, resp.content))
@@ -128,7 +103,7 @@ def reo_optimize_NickResource(post):
     post_url = root_url + '/v1/job/?format=json' #&api_key=' + API_KEY
     results_url = root_url + '/v1/job/<run_uuid>/results' #/?api_key=' + API_KEY
 
-    resp = requests.post(url=post_url, json=post)
+    resp = http_client.post(url=post_url, json=post)
 
     if not resp.ok:
         print("Status code {}. {}".format(resp.status_code, resp.content))
@@ -149,7 +124,7 @@ def reo_optimize_development(post):
     post_url = root_url + '/v1/job/?format=json&api_key=' + API_KEY
     results_url = root_url + '/v1/job/<run_uuid>/results/?api_key=' + API_KEY
 
-    resp = requests.post(url=post_url, json=post, verify=False)
+    resp = http_client.post(url=post_url, json=post, verify=False)
 
     if not resp.ok:
         print("Status code {}. {}".format(resp.status_code, resp.content))
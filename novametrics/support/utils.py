@@ -1,8 +1,13 @@
 import os
 import json
+import math
 import pickle
 import numpy as np
 import pandas as pd 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 def not_none(val):
     """Returns False if val is None"""
@@ -61,16 +66,87 @@ def get_filename(path, end_conditions):
     return filename
 
 
+def round_floats(val, float_digits):
+    """Return copy of `val` with floats rounded to `float_digits` significant digits"""
+    if isinstance(val, float):
+        return float(f"{val:.{float_digits}g}")
+    elif isinstance(val, dict):
+        return {k: round_floats(v, float_digits) for k, v in val.items()}
+    elif isinstance(val, (list, tuple)):
+        return [round_floats(v, float_digits) for v in val]
+    elif isinstance(val, np.ndarray):
+        return round_floats(val.tolist(), float_digits)
+    return val
+
+
+def dumps(obj, pretty = False, float_digits = None):
+    """
+    Return `obj` serialized to json bytes
+
+    Uses orjson if it is installed, otherwise the json module. Output is compact unless
+    `pretty` is True (for debugging). If `float_digits` is given then floats are rounded
+    to that many significant digits first. Numpy arrays and scalars are serialized as lists and numbers.
+    NaN and infinite floats are written as null, as orjson does, so output does not depend on which module is used.
+    """
+    if float_digits is not None:
+        obj = round_floats(obj, float_digits)
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if pretty else 0)
+        try:
+            return orjson.dumps(obj, option=option)
+        except TypeError:
+            # e.g. integers larger than 64 bits, which only the json module handles
+            pass
+    obj = non_finite_to_none(obj)
+    if pretty:
+        return json.dumps(obj, indent=2, default=to_json_default, allow_nan=False).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), default=to_json_default, allow_nan=False).encode("utf-8")
+
+
+def non_finite_to_none(val):
+    """Return copy of `val` with NaN and infinite floats (including in numpy arrays) replaced by None"""
+    if isinstance(val, (float, np.floating)):
+        return float(val) if math.isfinite(val) else None
+    elif isinstance(val, dict):
+        return {k: non_finite_to_none(v) for k, v in val.items()}
+    elif isinstance(val, (list, tuple)):
+        return [non_finite_to_none(v) for v in val]
+    elif isinstance(val, np.ndarray):
+        return non_finite_to_none(val.tolist())
+    return val
+
+
+def to_json_default(val):
+    """Convert numpy values which the json module cannot serialize"""
+    if isinstance(val, np.ndarray):
+        return val.tolist()
+    elif isinstance(val, np.generic):
+        return val.item()
+    raise TypeError(f"Object of type {type(val).__name__} is not JSON serializable")
+
+
+def loads(data):
+    """Return python object from json `data` (str or bytes), parsed with orjson if it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects NaN and Infinity, which the json module writes
+            pass
+    return json.loads(data)
+
+
 def load_post(path, filename):
     # Load a json into a python dictionary
-    with open(os.path.join(path, filename), 'r') as fp:
-        post = json.load(fp)
+    with open(os.path.join(path, filename), 'rb') as fp:
+        post = loads(fp.read())
     return post
 
 
-def save_post(post, path, filename):
-    with open(os.path.join(path, filename), 'w') as fp:
-        json.dump(post, fp, indent = 2)
+def save_post(post, path, filename, pretty = False, float_digits = None):
+    """Save `post` as json. Compact by default, or indented if `pretty` is True. See `dumps` for `float_digits`."""
+    with open(os.path.join(path, filename), 'wb') as fp:
+        fp.write(dumps(post, pretty, float_digits))
 
  
 def save_api_results(api_response, path, filename):
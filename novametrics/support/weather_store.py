@@ -0,0 +1,112 @@
+"""
+Shared local store of OCHRE weather files
+
+OCHRE's default weather source is the BuildStock TMY3 archive, one EPW file per county.
+Rather than each run downloading and opening the archive, the store keeps its EPW files
+in tmy3/, extracted once, with an index recording which archive they came from.
+OCHRE is passed the folder of extracted files and reads each building's weather file itself.
+
+The TMY3 archive can be extracted ahead of an OCHRE run with
+    nova_weather tmy3 --store weather_store
+"""
+import os
+import json
+import shutil
+import zipfile
+import argparse
+from novametrics.support import http_client
+from novametrics.support.utils import get_dictionary_value
+
+TMY3_URL = "https://data.nrel.gov/system/files/156/BuildStock_TMY3_FIPS.zip"
+INDEX_FILE = "index.json"
+
+
+def get_store_folder(ochre_controls):
+    """Return weather store folder set by the "weather_store" value of `ochre_controls` (defaults to "weather_store")"""
+    return get_dictionary_value(ochre_controls, "weather_store", "weather_store")
+
+
+def download_file(url, path):
+    """Stream `url` to `path`, written to a temporary file first so an interrupted download is not mistaken for a complete one"""
+    tmp = path + ".tmp"
+    resp = http_client.get(url, stream=True)
+    resp.raise_for_status()
+    with open(tmp, "wb") as fp:
+        for chunk in resp.iter_content(chunk_size=1 << 20):
+            fp.write(chunk)
+    os.replace(tmp, path)
+
+
+def load_index(folder):
+    try:
+        with open(os.path.join(folder, INDEX_FILE), "r") as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def extract_tmy3(store_folder, archive = TMY3_URL):
+    """
+    Extract the EPW files of TMY3 `archive` (path or url of a zip) into `store_folder`/tmy3 and index them
+
+    Does nothing if the store already holds this archive. Returns the folder of extracted EPW files.
+    """
+    folder = os.path.join(store_folder, "tmy3")
+    index = load_index(folder)
+    if index is not None and index.get("source") == archive:
+        return folder
+    os.makedirs(folder, exist_ok=True)
+    if archive.startswith("http://") or archive.startswith("https://"):
+        archive_path = os.path.join(folder, os.path.basename(archive))
+        if not os.path.isfile(archive_path):
+            print(f"Downloading weather archive {archive}")
+            download_file(archive, archive_path)
+    else:
+        archive_path = archive
+
+    print(f"Extracting weather archive {archive_path} to {folder}")
+    files = []
+    with zipfile.ZipFile(archive_path) as zf:
+        for member in zf.infolist():
+            if member.is_dir() or not member.filename.lower().endswith(".epw"):
+                continue
+            # Flatten the archive's folders, so files are found by name
+            file_name = os.path.basename(member.filename)
+            with zf.open(member) as src, open(os.path.join(folder, file_name), "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            files.append(file_name)
+
+    tmp = os.path.join(folder, INDEX_FILE + ".tmp")
+    with open(tmp, "w") as fp:
+        json.dump({"source": archive, "files": sorted(set(files))}, fp, indent=0)
+    os.replace(tmp, os.path.join(folder, INDEX_FILE))
+    print(f"Extracted {len(set(files))} weather files")
+    return folder
+
+
+def get_weather_folder(ochre_controls):
+    """
+    Return local weather folder to pass to OCHRE for the "weather_file_path" of `ochre_controls`
+
+    Zip archives (paths or urls, defaulting to the BuildStock TMY3 archive) are extracted into the weather store
+    once and the folder of extracted files is returned. Other paths are returned unchanged.
+    """
+    weather_path = get_dictionary_value(ochre_controls, "weather_file_path", TMY3_URL)
+    if not str(weather_path).lower().endswith(".zip"):
+        return weather_path
+    return os.path.abspath(extract_tmy3(get_store_folder(ochre_controls), weather_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the shared local weather store used by OCHRE runs.")
+    parser.add_argument("command", choices=["tmy3"], help="tmy3: extract and index a TMY3 archive.")
+    parser.add_argument("--store", default="weather_store", help="Weather store folder.")
+    parser.add_argument("--archive", default=TMY3_URL, help="Path or url of TMY3 zip archive.")
+    args = parser.parse_args()
+
+    folder = extract_tmy3(args.store, args.archive)
+    print(f"Weather store {args.store} holds {len(load_index(folder)['files'])} {args.command} weather files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Runs independent jobs in long-lived, recycled worker processes
+
+`run_pooled` starts up to `n_workers` worker processes. Each runs an optional initializer once
+(e.g. heavy imports) and then serves jobs one at a time over a pipe, so startup cost is paid
+once per worker rather than once per job. A worker is recycled (exits and is replaced by a
+fresh one) after `max_jobs_per_worker` jobs, or once its memory use passes `max_memory_mb`,
+which bounds the damage of leaks. A job which crashes its worker cannot take down the others
+or the parent: its result records the exit code and a new worker takes over.
+`max_jobs_per_worker=1` runs every job in a fresh process of its own.
+
+Each result is given the telemetry keys:
+-startup_seconds: seconds from starting the worker until it was ready, charged to its first job (0 for later jobs)
+-worker_pid, worker_job_number: the worker which ran the job and how many jobs it had run including this one
+-worker_rss_mb: resident memory of the worker after the job (None where /proc is not available)
+-worker_peak_rss_mb: peak resident memory of the worker over its lifetime, up to the end of the job
+
+Used by `run_ochre` to simulate buildings in parallel.
+"""
+import os
+import sys
+import time
+import multiprocessing
+from multiprocessing.connection import wait
+
+
+def current_rss_mb():
+    """Return resident memory of this process in MB, or None if it cannot be read from /proc on this platform"""
+    try:
+        with open("/proc/self/statm", "r") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    """Return peak resident memory of this process over its lifetime in MB, or None if it cannot be read on this platform"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    bytes_per_unit = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * bytes_per_unit / 1e6
+
+
+def _worker_main(conn, func, args, initializer, initargs, max_jobs, max_memory_mb):
+    try:
+        if initializer is not None:
+            initializer(*initargs)
+    except BaseException as e:
+        conn.send(("init_error", f"{type(e).__name__}: {e}"))
+        conn.close()
+        return
+    conn.send(("ready",))
+    n_jobs = 0
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        start = time.time()
+        try:
+            result = func(job, *args)
+        except BaseException as e:
+            result = {"job": job, "status": "failed", "error": f"{type(e).__name__}: {e}", "seconds": time.time() - start}
+        n_jobs += 1
+        rss_mb, peak_mb = current_rss_mb(), peak_rss_mb()
+        result.update({"worker_pid": os.getpid(), "worker_job_number": n_jobs, "worker_rss_mb": rss_mb, "worker_peak_rss_mb": peak_mb})
+        # Without /proc only the peak is known, which is the memory the worker once reached rather than holds now
+        memory_mb = rss_mb if rss_mb is not None else peak_mb
+        recycle = (max_jobs is not None and n_jobs >= max_jobs) or (max_memory_mb is not None and memory_mb is not None and memory_mb > max_memory_mb)
+        conn.send(("result", result, recycle))
+        if recycle:
+            break
+    conn.close()
+
+
+def crashed_result(job, exitcode, seconds):
+    """Return result of `job` whose worker exited with `exitcode` before sending a result"""
+    return {"job": job, "status": "failed", "error": f"Worker process exited with code {exitcode}", "seconds": seconds}
+
+
+def run_pooled(jobs, func, args = (), n_workers = 1, max_jobs_per_worker = None, max_memory_mb = None, initializer = None, initargs = (),
+               on_result = None, start_method = None):
+    """
+    Return list of results of `func(job, *args)` for each of `jobs`, run in long-lived worker processes
+
+    Parameters
+    ----------
+    jobs : list
+        Picklable jobs.
+    func : function
+        Module level function returning a picklable result (a dictionary) for one job.
+    args : tuple
+        Extra arguments passed to every call of `func`.
+    n_workers : int
+        Number of worker processes (and so jobs running at once).
+    max_jobs_per_worker : int, optional
+        Number of jobs after which a worker is replaced. Defaults to no limit.
+    max_memory_mb : float, optional
+        Resident memory after a job above which a worker is replaced. Where /proc is not available the peak memory
+        of the worker is compared instead. Defaults to no limit.
+    initializer : function, optional
+        Module level function called once in each worker with `initargs`, before it runs jobs.
+        If it raises then `run_pooled` raises RuntimeError.
+    on_result : function, optional
+        Called with each result as soon as its job finishes.
+    start_method : str, optional
+        multiprocessing start method ("fork", "spawn" or "forkserver"). Defaults to the platform default.
+
+    Returns
+    -------
+    list
+        Results in order of completion. Jobs whose worker crashed have a result from `crashed_result`.
+    """
+    context = multiprocessing.get_context(start_method)
+    pending = list(jobs)
+    workers = {}  # parent end of worker pipe -> {"process", "started", "startup_seconds", "job", "job_start", "n_done"}
+    results = []
+
+    def start_worker():
+        conn, worker_conn = context.Pipe()
+        process = context.Process(target=_worker_main, args=(worker_conn, func, args, initializer, initargs, max_jobs_per_worker, max_memory_mb),
+                                  daemon=True)
+        process.start()
+        # Only the worker holds its end, so the pipe reads EOF if the worker dies
+        worker_conn.close()
+        workers[conn] = {"process": process, "started": time.time(), "startup_seconds": None, "job": None, "job_start": None, "n_done": 0}
+
+    def stop_worker(conn):
+        worker = workers.pop(conn)
+        conn.close()
+        worker["process"].join()
+        return worker
+
+    def next_job(conn, worker):
+        if pending:
+            worker["job"], worker["job_start"] = pending.pop(0), time.time()
+            conn.send(worker["job"])
+        else:
+            conn.send(None)
+            stop_worker(conn)
+
+    def finish(result):
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+
+    try:
+        for i in range(min(max(n_workers, 1), len(pending))):
+            start_worker()
+        while workers:
+            for conn in wait(list(workers)):
+                worker = workers[conn]
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    stop_worker(conn)
+                    if worker["startup_seconds"] is None:
+                        raise RuntimeError(f"Worker process exited with code {worker['process'].exitcode} while starting")
+                    if worker["job"] is not None:
+                        result = crashed_result(worker["job"], worker["process"].exitcode, time.time() - worker["job_start"])
+                        result["startup_seconds"] = worker["startup_seconds"] if worker["n_done"] == 0 else 0
+                        finish(result)
+                    if pending:
+                        start_worker()
+                    continue
+
+                if message[0] == "init_error":
+                    raise RuntimeError(f"Worker process failed to start: {message[1]}")
+                elif message[0] == "ready":
+                    worker["startup_seconds"] = time.time() - worker["started"]
+                    next_job(conn, worker)
+                else:
+                    result, recycle = message[1], message[2]
+                    result["startup_seconds"] = worker["startup_seconds"] if worker["n_done"] == 0 else 0
+                    worker["job"] = None
+                    worker["n_done"] += 1
+                    finish(result)
+                    if recycle:
+                        stop_worker(conn)
+                        if pending:
+                            start_worker()
+                    else:
+                        next_job(conn, worker)
+    finally:
+        for worker in workers.values():
+            worker["process"].terminate()
+    return results
@@ -9,6 +9,9 @@ import pandas as pd
 import argparse
 from novametrics.inputs.create_reopt_posts import create_reopt_posts
 from novametrics.run_programs.run_reopt import run_reopt
+from novametrics.support.result_cache import ResultCache
+from novametrics.support import rate_limiter
+from novametrics.support.post_scheduler import parse_priorities
 from novametrics.run_programs.run_ochre import run_ochre
 from novametrics.run_programs.run_resstock import run_resstock
 from novametrics.analyze_results.generate_metrics import generate_metrics, generate_timeseries
@@ -26,7 +29,17 @@ def main():
     parser.add_argument("-i", "--inputs_file_path", default = "Inputs.xlsx", help = "Optionally specify path to input xlsx file (relative to main folder).")
     parser.add_argument("-g", "--by_building", action = "store_true", help = "If specified then runs REopt post and metrics for each building type")
     parser.add_argument("-s", "--start", type=int, nargs='?', default=1, help = "If specified then sets subfolder to begin running REopt")
-    parser.add_argument("--n_workers", type=int, nargs='?', default=2, help = "Number of workers to run in parallel for buildstockbatcho")
+    parser.add_argument("--n_workers", type=int, nargs='?', default=None, help = "Number of workers to run in parallel for buildstockbatch (defaults to 2) and OCHRE (defaults to the OCHRE sheet n_workers value, or 1)")
+    parser.add_argument("--rerun_ochre", action="store_true", help = "Simulate every OCHRE building, even if its outputs are complete.")
+    parser.add_argument("--retry_failed_ochre", action="store_true", help = "Only simulate the OCHRE buildings which failed in earlier runs.")
+    parser.add_argument("--regenerate_posts", action="store_true", help = "Rewrite every REopt post, even if its inputs have not changed.")
+    parser.add_argument("--pretty_json", action="store_true", help = "Save REopt posts as indented json for debugging. Defaults to compact json.")
+    parser.add_argument("--post_workers", type=int, nargs='?', default=1, help = "Number of processes to create REopt posts with. Defaults to 1.")
+    parser.add_argument("--no_cache", action="store_true", help = "Submit every REopt post even if identical results are in the REopt results cache.")
+    parser.add_argument("--api_requests_per_hour", type=float, default=None, help = "Hourly request limit of the NREL developer API key. Defaults to 1000, or the limit reported by the API. A given limit is never raised by the API's limit.")
+    parser.add_argument("--reopt_priority", nargs="*", default=[], help = "Priorities for REopt posts as pattern=priority, e.g. *baseline*=10. Higher priority posts run first.")
+    parser.add_argument("--uncompressed_results", action="store_true", help = "Save REopt results as plain json instead of compressed json.")
+    parser.add_argument("--reopt_workers", type=int, nargs='?', default=1, help = "Number of REopt jobs to keep in flight at once. Defaults to 1 (run posts one after another).")
     args = parser.parse_args()
 
     main_folder = args.main_folder
@@ -44,6 +57,8 @@ def main():
 
     api_keys = inputs["API Keys"]
     api_keys = dict(zip(api_keys.key_name, api_keys.key_val))
+    if args.api_requests_per_hour is not None:
+        rate_limiter.configure_host("developer.nrel.gov", args.api_requests_per_hour)
     
     #%%
     if "resstock_output_main_folder" not in filepaths:
@@ -51,14 +66,15 @@ def main():
             
     if args.all or args.buildstock:
         print("Running buildstockbatch to query ResStock")
+        resstock_workers = args.n_workers if args.n_workers is not None else 2
         if "resstock_yaml" in filepaths:
             run_resstock(main_folder, filepaths["resstock_yaml"], filepaths["resstock_output_main_folder"], temp_folder_name = "temp_folder", 
-                            simulations_job = "simulations_job0.tar.gz", root_folder = "up00/", save_files = ("in.xml", "schedules.csv"), n_workers = args.n_workers)
+                            simulations_job = "simulations_job0.tar.gz", root_folder = "up00/", save_files = ("in.xml", "schedules.csv"), n_workers = resstock_workers)
         elif os.path.exists("resstock.yml"):
             print("No resstock yaml file specified. Defaulting to resstock.yml in main folder")
            
             run_resstock(main_folder, "resstock.yml", filepaths["resstock_output_main_folder"], temp_folder_name = "temp_folder", 
-                        simulations_job = "simulations_job0.tar.gz", root_folder = "up00/", save_files = ("in.xml", "schedules.csv"), n_workers = args.n_workers)
+                        simulations_job = "simulations_job0.tar.gz", root_folder = "up00/", save_files = ("in.xml", "schedules.csv"), n_workers = resstock_workers)
         else:
             raise Exception("Could not fine resstock.yml file. Please specify name in the Inputs File Paths tab or add a file named resstock.yml to the main folder.")
     
@@ -83,19 +99,26 @@ def main():
     
     if args.all or args.ochre:
         print("Running OCHRE")
-        run_ochre(ochre_controls)
+        run_ochre(ochre_controls, n_workers = args.n_workers, incremental = not args.rerun_ochre, retry_failed = args.retry_failed_ochre)
     
     if args.posts or args.all:
         print("Creating REopt posts.")
         create_reopt_posts(main_folder, inputs_file_name, filepaths["default_values_file"], filepaths["reopt_posts"], by_building = args.by_building, add_pv_prod_factor = True,
-                       solar_profile_folder = filepaths["solar_profile_folder"], pv_watts_api_key = api_keys["pv_watts"], ochre_controls = ochre_controls)
+                       solar_profile_folder = filepaths["solar_profile_folder"], pv_watts_api_key = api_keys["pv_watts"], ochre_controls = ochre_controls,
+                       n_workers = args.post_workers, incremental = not args.regenerate_posts, pretty_json = args.pretty_json)
         
     if args.reopt or args.all:
         if "reopt_root_url" in filepaths:
             root_url = filepaths["reopt_root_url"]
         else:
             root_url = 'https://developer.nrel.gov/api/reopt'
-        run_reopt(filepaths["reopt_posts"], filepaths["reopt_results"], api_keys["reopt"], start_folder = args.start, root_url = root_url, overwrite = args.keep_runs)
+        if args.no_cache:
+            cache = None
+        else:
+            cache = ResultCache(filepaths.get("reopt_cache", "reopt_cache"))
+        run_reopt(filepaths["reopt_posts"], filepaths["reopt_results"], api_keys["reopt"], start_folder = args.start, root_url = root_url, overwrite = args.keep_runs,
+                  reopt_workers = args.reopt_workers, cache = cache, priorities = parse_priorities(args.reopt_priority),
+                  compress_results = not args.uncompressed_results)
 
     if args.metrics or args.all:
         metrics_inputs = inputs["Generate Metrics"]
@@ -42,7 +42,11 @@ setup(name='novametrics',
     entry_points={
         'console_scripts': [
             'nova_workflow=novametrics.workflow:main',
-            'nova_installer=novametrics.installation_helper:main'
+            'nova_installer=novametrics.installation_helper:main',
+            'nova_cache=novametrics.support.result_cache:main',
+            'nova_results=novametrics.support.result_store:main',
+            'nova_ochre_sidecar=novametrics.inputs.ochre_sidecar:main',
+            'nova_weather=novametrics.support.weather_store:main'
         ]
     },
     install_requires=requirements